@@ -0,0 +1,180 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import aiohttp
+from fastapi import Header, HTTPException, status
+
+# name:max_concurrency:max_queue, comma separated, overrides DEFAULT_LIMITS
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "")
+# Longest a request waits for a slot when the client sent no X-Request-Timeout
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+DEFAULT_LIMITS = {
+    "generate": (4, 8),
+    "bundle": (2, 4),
+    "waveform": (4, 16),
+    "library": (2, 4),
+}
+DEFAULT_LIMIT = (32, 64)
+
+# Monotonic deadline of the current request, None when the client gave none
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, None if unbounded"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def client_timeout() -> aiohttp.ClientTimeout:
+    """aiohttp timeout bounded by the current request's deadline"""
+    remaining = remaining_time()
+    if remaining is None:
+        return aiohttp.ClientTimeout(total=300)
+    if remaining <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return aiohttp.ClientTimeout(total=remaining)
+
+
+class RouteLimiter:
+    """Concurrency limit with a bounded FIFO wait queue for one route"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: deque = deque()
+        self.admitted = 0
+        self.rejected = 0
+        # Moving average of how long a request holds its slot
+        self.avg_service_time = 1.0
+
+    def retry_after(self) -> int:
+        backlog = len(self.waiters) + 1
+        return max(1, math.ceil(self.avg_service_time * backlog / self.max_concurrency))
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"{reason}, try again later",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, timeout: Optional[float]):
+        if self.active < self.max_concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            self._reject("Server busy")
+        # Expected wait already exceeds what the client is willing to wait
+        expected = self.avg_service_time * (len(self.waiters) + 1) / self.max_concurrency
+        if timeout is not None and expected > timeout:
+            self._reject("Server busy")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._reject("Timed out waiting in queue")
+            # Slot was handed over right as we timed out, keep it
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        finally:
+            if future in self.waiters:
+                self.waiters.remove(future)
+        self.admitted += 1
+
+    def release(self, service_time: Optional[float] = None):
+        if service_time is not None:
+            self.avg_service_time += 0.2 * (service_time - self.avg_service_time)
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                # Hand the slot straight to the next waiter
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def _load_limits() -> Dict[str, tuple]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in ADMISSION_LIMITS.split(","):
+        if item.strip():
+            name, max_concurrency, max_queue = item.strip().split(":")
+            limits[name] = (int(max_concurrency), int(max_queue))
+    return limits
+
+
+_limits = _load_limits()
+limiters: Dict[str, RouteLimiter] = {}
+
+
+def get_limiter(name: str) -> RouteLimiter:
+    if name not in limiters:
+        max_concurrency, max_queue = _limits.get(name, DEFAULT_LIMIT)
+        limiters[name] = RouteLimiter(name, max_concurrency, max_queue)
+    return limiters[name]
+
+
+def admit(name: str):
+    """Route dependency holding one of the route's slots for the whole request
+
+    X-Request-Timeout (seconds) bounds the queue wait and becomes the deadline
+    for upstream calls made by the request.
+    """
+    limiter = get_limiter(name)
+
+    async def dependency(
+        x_request_timeout: Optional[float] = Header(default=None, gt=0, allow_inf_nan=False)
+    ):
+        if x_request_timeout is not None:
+            request_deadline.set(time.monotonic() + x_request_timeout)
+        timeout = x_request_timeout if x_request_timeout is not None else ADMISSION_MAX_WAIT
+        await limiter.acquire(timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            limiter.release(time.monotonic() - start)
+
+    return dependency
+
+
+def get_stats() -> Dict[str, Any]:
+    return {name: limiter.get_stats() for name, limiter in limiters.items()}
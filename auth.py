@@ -1,17 +1,19 @@
 # -*- coding:utf-8 -*-
 
+import asyncio
 import os
 import time
 import base64
 import json
 import uuid
 from http.cookies import SimpleCookie
-from threading import Lock
 from typing import Optional
 
-import aiohttp
 import jwt
 
+from http_session import get_http_session
+from profiling import span
+
 
 class SunoAuth:
     """Manages Suno authentication with automatic token renewal"""
@@ -23,7 +25,7 @@ class SunoAuth:
         
         self.token: Optional[str] = None
         self.token_expiry: Optional[float] = None
-        self.lock = Lock()
+        self.lock = asyncio.Lock()
         
     def _decode_jwt(self, token: str) -> dict:
         """Decode JWT without verification to get expiry"""
@@ -74,41 +76,42 @@ class SunoAuth:
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers) as resp:
-                if resp.status != 200:
-                    error_text = await resp.text()
-                    raise Exception(f"Failed to get token from Clerk: {resp.status} - {error_text}")
-                
-                # Update cookies from response
-                set_cookie = resp.headers.get("Set-Cookie")
-                if set_cookie:
-                    cookie = SimpleCookie()
-                    cookie.load(set_cookie)
-                    # Merge new cookies
-                    existing_cookie = SimpleCookie()
-                    existing_cookie.load(self.cookie_str)
-                    for key in cookie.keys():
-                        existing_cookie[key] = cookie[key]
-                    self.cookie_str = ";".join([f"{k}={existing_cookie[k].value}" for k in existing_cookie.keys()])
-                
-                data = await resp.json()
-                jwt_token = data.get("jwt")
-                
-                if not jwt_token:
-                    raise Exception("No JWT token in Clerk response")
-                
-                return jwt_token
+        session = get_http_session()
+        async with session.post(url, headers=headers) as resp:
+            if resp.status != 200:
+                error_text = await resp.text()
+                raise Exception(f"Failed to get token from Clerk: {resp.status} - {error_text}")
+            
+            # Update cookies from response
+            set_cookie = resp.headers.get("Set-Cookie")
+            if set_cookie:
+                cookie = SimpleCookie()
+                cookie.load(set_cookie)
+                # Merge new cookies
+                existing_cookie = SimpleCookie()
+                existing_cookie.load(self.cookie_str)
+                for key in cookie.keys():
+                    existing_cookie[key] = cookie[key]
+                self.cookie_str = ";".join([f"{k}={existing_cookie[k].value}" for k in existing_cookie.keys()])
+            
+            data = await resp.json()
+            jwt_token = data.get("jwt")
+            
+            if not jwt_token:
+                raise Exception("No JWT token in Clerk response")
+            
+            return jwt_token
     
     async def get_token(self) -> str:
         """Get a valid token, renewing if necessary"""
-        with self.lock:
+        async with self.lock:
             if self._is_token_valid():
                 return self.token
             
             # Need to renew
             print("Renewing Suno authentication token...")
-            self.token = await self._get_token_from_clerk()
+            with span("token"):
+                self.token = await self._get_token_from_clerk()
             
             # Decode to get expiry
             payload = self._decode_jwt(self.token)
@@ -134,6 +137,13 @@ class SunoAuth:
         return f'{{"token":"{token_b64}"}}'
 
 
-# Global auth instance
-suno_auth = SunoAuth()
+_suno_auth: Optional[SunoAuth] = None
+
+
+def get_suno_auth() -> SunoAuth:
+    """Global auth instance, created on first use instead of at import"""
+    global _suno_auth
+    if _suno_auth is None:
+        _suno_auth = SunoAuth()
+    return _suno_auth
 
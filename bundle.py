@@ -0,0 +1,316 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import json
+import os
+import struct
+import tarfile
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aiohttp
+from fastapi.responses import StreamingResponse
+
+from suno_client import get_feed, extract_clips
+from prefetch import audio_store
+
+BUNDLE_CONCURRENCY = int(os.getenv("BUNDLE_CONCURRENCY", "4"))
+CHUNK_SIZE = 65536
+# Chunks buffered per clip while the archive is busy writing another entry
+QUEUE_CHUNKS = 4
+MANIFEST_NAME = "manifest.json"
+
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP_ENTRY_LIMIT = 0xFFFF
+
+
+class ZipStreamWriter:
+    """Writes a stored (uncompressed) ZIP without seeking, sizes go in data descriptors
+
+    Entries of unknown or 4 GiB+ size get ZIP64 local headers and descriptors, and the
+    central directory switches to ZIP64 records once offsets or the entry count overflow.
+    """
+
+    media_type = "application/zip"
+    extension = "zip"
+
+    def __init__(self):
+        self.offset = 0
+        self.entries = []
+        self.current = None
+        dt = time.localtime()
+        self.dos_time = (dt.tm_hour << 11) | (dt.tm_min << 5) | (dt.tm_sec // 2)
+        self.dos_date = ((dt.tm_year - 1980) << 9) | (dt.tm_mon << 5) | dt.tm_mday
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def start_entry(self, name: str, size: Optional[int] = None) -> bytes:
+        name_bytes = name.encode("utf-8")
+        zip64 = size is None or size >= ZIP32_LIMIT
+        self.current = {"name": name_bytes, "offset": self.offset, "crc": 0, "size": 0, "zip64": zip64}
+        if zip64:
+            # Real sizes follow in the descriptor, the extra field only reserves their width
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            version, sizes = 45, ZIP32_LIMIT
+        else:
+            extra = b""
+            version, sizes = 20, 0
+        # Bit 3: sizes follow the data, bit 11: UTF-8 file name
+        header = struct.pack(
+            "<IHHHHHIIIHH",
+            0x04034b50, version, 0x0808, 0, self.dos_time, self.dos_date,
+            0, sizes, sizes, len(name_bytes), len(extra)
+        )
+        return self._emit(header + name_bytes + extra)
+
+    def write(self, chunk: bytes) -> bytes:
+        self.current["crc"] = zlib.crc32(chunk, self.current["crc"])
+        self.current["size"] += len(chunk)
+        return self._emit(chunk)
+
+    def end_entry(self) -> bytes:
+        entry, self.current = self.current, None
+        self.entries.append(entry)
+        if entry["zip64"]:
+            descriptor = struct.pack("<IIQQ", 0x08074b50, entry["crc"], entry["size"], entry["size"])
+        elif entry["size"] >= ZIP32_LIMIT:
+            # The announced size was wrong and the local header has no room for this one
+            raise ValueError(f"ZIP entry {entry['name'].decode()} is larger than announced")
+        else:
+            descriptor = struct.pack("<IIII", 0x08074b50, entry["crc"], entry["size"], entry["size"])
+        return self._emit(descriptor)
+
+    def _central_entry(self, entry: Dict[str, Any]) -> bytes:
+        size, offset = entry["size"], entry["offset"]
+        # ZIP64 extra holds only the fields that overflow, in this order
+        extra_fields = []
+        if size >= ZIP32_LIMIT:
+            extra_fields += [size, size]
+            size = ZIP32_LIMIT
+        if offset >= ZIP32_LIMIT:
+            extra_fields.append(offset)
+            offset = ZIP32_LIMIT
+        extra = b""
+        if extra_fields:
+            extra = struct.pack(f"<HH{len(extra_fields)}Q", 0x0001, 8 * len(extra_fields), *extra_fields)
+        version = 45 if extra or entry["zip64"] else 20
+        return struct.pack(
+            "<IHHHHHHIIIHHHHHII",
+            # Made by Unix (host 3) so the mode in the external attributes is honoured
+            0x02014b50, (3 << 8) | version, version, 0x0808, 0, self.dos_time, self.dos_date,
+            entry["crc"], size, size, len(entry["name"]),
+            len(extra), 0, 0, 0, 0o100644 << 16, offset
+        ) + entry["name"] + extra
+
+    def close(self) -> bytes:
+        cd_offset = self.offset
+        central = b"".join(self._central_entry(entry) for entry in self.entries)
+        count = len(self.entries)
+        end = b""
+        if count >= ZIP_ENTRY_LIMIT or len(central) >= ZIP32_LIMIT or cd_offset >= ZIP32_LIMIT:
+            zip64_end_offset = cd_offset + len(central)
+            end += struct.pack(
+                "<IQHHIIQQQQ",
+                0x06064b50, 44, 45, 45, 0, 0, count, count, len(central), cd_offset
+            )
+            end += struct.pack("<IIQI", 0x07064b50, 0, zip64_end_offset, 1)
+        end += struct.pack(
+            "<IHHHHIIH",
+            0x06054b50, 0, 0, min(count, ZIP_ENTRY_LIMIT), min(count, ZIP_ENTRY_LIMIT),
+            min(len(central), ZIP32_LIMIT), min(cd_offset, ZIP32_LIMIT), 0
+        )
+        return self._emit(central + end)
+
+
+class TarStreamWriter:
+    """Writes a ustar/pax TAR, each entry needs its size before the data"""
+
+    media_type = "application/x-tar"
+    extension = "tar"
+
+    def __init__(self):
+        self.remaining = 0
+        self.size = 0
+
+    def start_entry(self, name: str, size: Optional[int] = None) -> bytes:
+        if size is None:
+            raise ValueError(f"TAR entry {name} needs a known size")
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.size = self.remaining = size
+        return info.tobuf(format=tarfile.PAX_FORMAT)
+
+    def write(self, chunk: bytes) -> bytes:
+        # Never write past the size announced in the header
+        chunk = chunk[:self.remaining]
+        self.remaining -= len(chunk)
+        return chunk
+
+    def end_entry(self) -> bytes:
+        # A short upstream body is zero filled so the archive stays readable
+        filler = b"\0" * self.remaining
+        self.remaining = 0
+        return filler + b"\0" * (-self.size % tarfile.BLOCKSIZE)
+
+    def close(self) -> bytes:
+        return b"\0" * (tarfile.BLOCKSIZE * 2)
+
+
+ARCHIVE_WRITERS = {
+    "zip": ZipStreamWriter,
+    "tar": TarStreamWriter,
+}
+
+
+class ClipSource:
+    """Fetches one clip into a small bounded queue so the archive can drain it later"""
+
+    def __init__(self, clip_id: str, audio_url: Optional[str], require_size: bool = False):
+        self.clip_id = clip_id
+        self.audio_url = audio_url
+        # TAR headers need the size up front, fail before queueing any audio without one
+        self.require_size = require_size
+        self.filename = f"{clip_id}.mp3"
+        self.size: Optional[int] = None
+        self.error: Optional[str] = None
+        self.ready = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_CHUNKS)
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            cancelled = False
+            try:
+                local_path = audio_store.get(self.clip_id)
+                if local_path:
+                    await self._read_file(local_path)
+                elif self.audio_url:
+                    await self._read_url()
+                else:
+                    raise Exception("Audio URL not found")
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            except Exception as e:
+                self.error = str(e)
+            finally:
+                self.ready.set()
+                # Nobody reads a cancelled source, waiting on a full queue would hang it
+                if not cancelled:
+                    await self.queue.put(None)
+
+    async def _read_file(self, path: str):
+        self.size = os.path.getsize(path)
+        self.ready.set()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await self.queue.put(chunk)
+
+    async def _read_url(self):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.audio_url) as resp:
+                if resp.status != 200:
+                    raise Exception(f"Failed to download audio: {resp.status}")
+                if self.require_size and resp.content_length is None:
+                    raise Exception("Unknown content length")
+                self.size = resp.content_length
+                self.ready.set()
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    await self.queue.put(chunk)
+
+
+async def stream_bundle(
+    clips: List[Dict[str, Any]],
+    clip_ids: List[str],
+    archive_format: str = "zip"
+) -> AsyncIterator[bytes]:
+    """Yield archive bytes, writing each clip as soon as its download starts"""
+    writer = ARCHIVE_WRITERS[archive_format]()
+    by_id = {clip.get("id"): clip for clip in clips}
+    semaphore = asyncio.Semaphore(BUNDLE_CONCURRENCY)
+    manifest = []
+
+    def manifest_entry(clip_id: str, audio_url: Optional[str]) -> Dict[str, Any]:
+        entry = {
+            "clip_id": clip_id,
+            "filename": None,
+            "title": by_id.get(clip_id, {}).get("title"),
+            "status": by_id.get(clip_id, {}).get("status"),
+            "audio_url": audio_url,
+            "size": None,
+            "error": None,
+        }
+        manifest.append(entry)
+        return entry
+
+    sources = []
+    for clip_id in dict.fromkeys(clip_ids):
+        clip = by_id.get(clip_id, {})
+        audio_url = clip.get("audio_url") or clip.get("audioUrl") or clip.get("audio")
+        if clip and clip.get("status") != "complete":
+            # A streaming clip's audio is still growing, it would be cut short
+            manifest_entry(clip_id, audio_url)["error"] = f"Clip is not complete: {clip.get('status')}"
+            continue
+        source = ClipSource(clip_id, audio_url, require_size=archive_format == "tar")
+        source.task = asyncio.create_task(source.run(semaphore))
+        sources.append(source)
+
+    waiting = {asyncio.ensure_future(s.ready.wait()): s for s in sources}
+    try:
+        while waiting:
+            done, _ = await asyncio.wait(waiting.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                source = waiting.pop(future)
+                entry = manifest_entry(source.clip_id, source.audio_url)
+
+                if source.error or (source.size is None and archive_format == "tar"):
+                    entry["error"] = source.error or "Unknown content length"
+                    source.task.cancel()
+                    continue
+
+                yield writer.start_entry(source.filename, source.size)
+                written = 0
+                while True:
+                    chunk = await source.queue.get()
+                    if chunk is None:
+                        break
+                    written += len(chunk)
+                    yield writer.write(chunk)
+                yield writer.end_entry()
+                entry["filename"] = source.filename
+                entry["size"] = written
+                if source.error:
+                    entry["error"] = source.error
+
+        body = json.dumps({"clips": manifest}, ensure_ascii=False, indent=2).encode("utf-8")
+        yield writer.start_entry(MANIFEST_NAME, len(body))
+        yield writer.write(body)
+        yield writer.end_entry()
+        yield writer.close()
+    finally:
+        for future in waiting:
+            future.cancel()
+        for source in sources:
+            source.task.cancel()
+
+
+async def download_bundle(clip_ids: List[str], archive_format: str = "zip") -> StreamingResponse:
+    """Resolve clips with one feed call and stream them as a ZIP or TAR"""
+    feed_data = await get_feed(clip_ids)
+    writer_cls = ARCHIVE_WRITERS[archive_format]
+    return StreamingResponse(
+        stream_bundle(extract_clips(feed_data), clip_ids, archive_format),
+        media_type=writer_cls.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="suno-bundle.{writer_cls.extension}"'
+        }
+    )
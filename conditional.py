@@ -0,0 +1,127 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.responses import Response
+
+CLIP_STATE_CACHE_SIZE = int(os.getenv("CLIP_STATE_CACHE_SIZE", "10000"))
+# Seconds a finished clip's state is trusted before the next poll goes to Suno again
+# (titles, images and play counts can still change)
+CLIP_STATE_TTL = float(os.getenv("CLIP_STATE_TTL", "300"))
+# Clips in these states rarely change, a matching ETag can be answered without Suno
+TERMINAL_STATUSES = {"complete", "error"}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Turn ?fields=status,audio_url into a list in the order given, None means everything"""
+    if not fields:
+        return None
+    return list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip())) or None
+
+
+def get_path(data: Dict[str, Any], path: str) -> Any:
+    """Look up a dotted field such as metadata.tags"""
+    value: Any = data
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def project(data: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only `fields`, dotted paths come back under their dotted name"""
+    if fields is None:
+        return data
+    return {field: get_path(data, field) for field in fields}
+
+
+def state_hash(clip: Dict[str, Any]) -> str:
+    """Stable hash of a clip document, independent of key order"""
+    canonical = json.dumps(clip, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def make_etag(kind: str, clip_hash: str, fields: Optional[List[str]] = None) -> str:
+    """ETag for one representation (route kind + field projection) of a clip state"""
+    variant = kind
+    if fields:
+        # Same field set in another order is the same representation
+        digest = hashlib.blake2b(",".join(sorted(fields)).encode("utf-8"), digest_size=4).hexdigest()
+        variant += "-" + digest
+    return f'"{variant}-{clip_hash}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, proxies may add W/ to our tags
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+class ClipStateCache:
+    """Last seen state hash per clip, so pollers can be answered with 304"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # clip_id -> (state hash, status, monotonic time it was fetched)
+        self.entries: "OrderedDict[str, Tuple[str, Optional[str], float]]" = OrderedDict()
+
+    def update(self, clip: Dict[str, Any]) -> str:
+        clip_hash = state_hash(clip)
+        clip_id = clip.get("id")
+        if clip_id:
+            self.entries[clip_id] = (clip_hash, clip.get("status"), time.monotonic())
+            self.entries.move_to_end(clip_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return clip_hash
+
+    def terminal_hash(self, clip_id: str) -> Optional[str]:
+        """State hash of a finished clip fetched within the TTL, None if Suno should be asked"""
+        entry = self.entries.get(clip_id)
+        if entry is None or entry[1] not in TERMINAL_STATUSES:
+            return None
+        if time.monotonic() - entry[2] > self.ttl:
+            return None
+        self.entries.move_to_end(clip_id)
+        return entry[0]
+
+
+# Global cache instance
+clip_state = ClipStateCache(CLIP_STATE_CACHE_SIZE, CLIP_STATE_TTL)
+
+
+def cached_not_modified(kind: str, clip_id: str, fields: Optional[List[str]],
+                        if_none_match: Optional[str]) -> Optional[Response]:
+    """304 straight from the state cache when the client already has the finished clip"""
+    if not if_none_match:
+        return None
+    clip_hash = clip_state.terminal_hash(clip_id)
+    if clip_hash is None:
+        return None
+    etag = make_etag(kind, clip_hash, fields)
+    return not_modified(etag) if etag_matches(if_none_match, etag) else None
+
+
+def check_clip(kind: str, clip: Dict[str, Any], fields: Optional[List[str]],
+               if_none_match: Optional[str], response: Response) -> Optional[Response]:
+    """Record a fresh clip state, set its ETag and return a 304 if the client is current"""
+    etag = make_etag(kind, clip_state.update(clip), fields)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return None
@@ -35,11 +35,6 @@ class SunoCookie:
         self.token = token
 
 
-suno_auth = SunoCookie()
-suno_auth.set_session_id(os.getenv("SESSION_ID"))
-suno_auth.load_cookie(os.getenv("COOKIE"))
-
-
 def update_token(suno_cookie: SunoCookie):
     headers = {"cookie": suno_cookie.get_cookie()}
     headers.update(COMMON_HEADERS)
@@ -70,8 +65,19 @@ def keep_alive(suno_cookie: SunoCookie):
 
 
 def start_keep_alive(suno_cookie: SunoCookie):
-    t = Thread(target=keep_alive, args=(suno_cookie,))
+    t = Thread(target=keep_alive, args=(suno_cookie,), daemon=True)
     t.start()
 
 
-start_keep_alive(suno_auth)
+_suno_cookie = None
+
+
+def get_suno_cookie() -> SunoCookie:
+    """Global cookie instance, its keep-alive thread starts on first use instead of at import"""
+    global _suno_cookie
+    if _suno_cookie is None:
+        _suno_cookie = SunoCookie()
+        _suno_cookie.set_session_id(os.getenv("SESSION_ID"))
+        _suno_cookie.load_cookie(os.getenv("COOKIE"))
+        start_keep_alive(_suno_cookie)
+    return _suno_cookie
@@ -1,10 +1,10 @@
 # -*- coding:utf-8 -*-
 
-from cookie import suno_auth
+from cookie import get_suno_cookie
 
 
 def get_token():
-    token = suno_auth.get_token()
+    token = get_suno_cookie().get_token()
     try:
         yield token
     finally:
@@ -2,10 +2,11 @@
 
 import aiohttp
 from typing import Optional, Dict, Any
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 import io
 
 from suno_client import get_feed
+from prefetch import audio_store, prefetcher
 
 
 async def get_audio_url(clip_id: str) -> Optional[str]:
@@ -39,6 +40,15 @@ async def get_audio_url(clip_id: str) -> Optional[str]:
 
 async def download_audio_stream(clip_id: str) -> Optional[StreamingResponse]:
     """Download audio file and return as streaming response"""
+    local_path = audio_store.get(clip_id)
+    prefetcher.record_download(served_locally=local_path is not None)
+    if local_path:
+        return FileResponse(
+            local_path,
+            media_type="audio/mpeg",
+            filename=f"{clip_id}.mp3"
+        )
+
     audio_url = await get_audio_url(clip_id)
     
     if not audio_url:
@@ -77,36 +87,17 @@ async def download_audio_stream(clip_id: str) -> Optional[StreamingResponse]:
     )
 
 
-async def get_audio_info(clip_id: str) -> Dict[str, Any]:
-    """Get audio information including URL and metadata"""
-    try:
-        feed_data = await get_feed([clip_id])
-        
-        # Extract clip data
-        clip = None
-        if isinstance(feed_data, list) and len(feed_data) > 0:
-            clip = feed_data[0]
-        elif isinstance(feed_data, dict):
-            clips = feed_data.get("clips", [])
-            if clips and len(clips) > 0:
-                clip = clips[0]
-            elif feed_data.get("id"):
-                clip = feed_data
-        
-        if not clip:
-            return {"error": "Clip not found"}
-        
-        # Extract audio URL
-        audio_url = clip.get("audio_url") or clip.get("audioUrl") or clip.get("audio")
-        
-        return {
-            "clip_id": clip_id,
-            "audio_url": audio_url,
-            "title": clip.get("title"),
-            "status": clip.get("status"),
-            "metadata": clip.get("metadata", {}),
-            "full_data": clip
-        }
-    except Exception as e:
-        return {"error": str(e)}
+def audio_info_from_clip(clip_id: str, clip: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the audio-info document from a feed clip"""
+    # Extract audio URL
+    audio_url = clip.get("audio_url") or clip.get("audioUrl") or clip.get("audio")
+    
+    return {
+        "clip_id": clip_id,
+        "audio_url": audio_url,
+        "title": clip.get("title"),
+        "status": clip.get("status"),
+        "metadata": clip.get("metadata", {}),
+        "full_data": clip
+    }
 
@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Max fraction of recent calls that may send a second attempt
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+# Don't hedge before the latency percentile means something
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+
+
+class HedgedOperation:
+    """Latency window and hedge counters for one idempotent upstream call"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: deque = deque(maxlen=HEDGE_WINDOW)
+        self.recent_hedges: deque = deque(maxlen=HEDGE_WINDOW)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, None while there are too few samples"""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(ordered[index], HEDGE_MIN_DELAY_MS / 1000)
+
+    def within_budget(self) -> bool:
+        # Would one more hedge keep the recent hedge rate within budget
+        return sum(self.recent_hedges) + 1 <= HEDGE_BUDGET * (len(self.recent_hedges) + 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else None,
+            "hedge_wins": self.hedge_wins,
+            "hedge_win_rate": round(self.hedge_wins / self.hedged, 4) if self.hedged else None,
+            "delay_ms": round(delay * 1000, 2) if delay is not None else None,
+        }
+
+
+class Hedger:
+    """Sends a second attempt when the first is slower than the recent percentile"""
+
+    def __init__(self):
+        self.operations: Dict[str, HedgedOperation] = {}
+
+    def _get_operation(self, name: str) -> HedgedOperation:
+        if name not in self.operations:
+            self.operations[name] = HedgedOperation(name)
+        return self.operations[name]
+
+    async def run(self, name: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+        op = self._get_operation(name)
+        op.calls += 1
+        start = time.monotonic()
+        delay = op.delay()
+        primary = asyncio.ensure_future(attempt())
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+            if delay is None or done or not op.within_budget():
+                op.recent_hedges.append(False)
+                result = await primary
+                op.latencies.append(time.monotonic() - start)
+                return result
+
+            op.recent_hedges.append(True)
+            op.hedged += 1
+            hedge = asyncio.ensure_future(attempt())
+            tasks.add(hedge)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            op.hedge_wins += 1
+                        op.latencies.append(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Loser or caller cancelled, don't leave attempts running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": HEDGING_ENABLED,
+            "budget": HEDGE_BUDGET,
+            "operations": {name: op.get_stats() for name, op in self.operations.items()},
+        }
+
+
+def hedged(name: str):
+    """Decorator for idempotent reads, a no-op unless HEDGING_ENABLED is set"""
+    def decorator(func):
+        if not HEDGING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await hedger.run(name, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+# Global hedger instance
+hedger = Hedger()
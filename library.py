@@ -0,0 +1,117 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from conditional import project
+from suno_client import get_feed_v3
+
+CSV_DEFAULT_FIELDS = [
+    "id", "title", "status", "created_at", "audio_url", "image_url",
+    "metadata.tags", "metadata.duration",
+]
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def iter_library_pages(
+    page_size: int = 20,
+    workspace_id: str = "default",
+    since: Optional[datetime] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield library pages, fetching the next page while the caller handles the current one
+
+    At most two pages are held at a time. With `since`, only clips created after it are
+    yielded and paging stops at the first older clip (the feed is newest first).
+    """
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    next_page: Optional[asyncio.Task] = asyncio.ensure_future(get_feed_v3(None, page_size, workspace_id))
+    try:
+        while next_page is not None:
+            page = await next_page
+            next_page = None
+            clips = page.get("clips") or []
+            reached_since = False
+            if since is not None:
+                newer = []
+                for clip in clips:
+                    created_at = _parse_time(clip.get("created_at"))
+                    if created_at is not None and created_at <= since:
+                        reached_since = True
+                        break
+                    newer.append(clip)
+                clips = newer
+            if page.get("has_more") and page.get("next_cursor") and not reached_since:
+                next_page = asyncio.ensure_future(
+                    get_feed_v3(page["next_cursor"], page_size, workspace_id)
+                )
+            yield clips
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def _pages_from(first: List[Dict[str, Any]], pages: AsyncIterator[List[Dict[str, Any]]]):
+    yield first
+    async for clips in pages:
+        yield clips
+
+
+async def stream_ndjson(
+    first: List[Dict[str, Any]],
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    fields: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """One JSON object per clip, one chunk per page"""
+    try:
+        async for clips in _pages_from(first, pages):
+            if clips:
+                yield "".join(
+                    json.dumps(project(clip, fields), ensure_ascii=False) + "\n" for clip in clips
+                ).encode("utf-8")
+    except Exception as e:
+        # Headers are already sent, tell the client the export is incomplete
+        yield (json.dumps({"error": str(e)}) + "\n").encode("utf-8")
+
+
+async def stream_csv(
+    first: List[Dict[str, Any]],
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    fields: Optional[List[str]] = None
+) -> AsyncIterator[bytes]:
+    """CSV with a header row, nested values are written as JSON
+
+    If a later page fails the last row is `#error,<message>`.
+    """
+    fields = fields or CSV_DEFAULT_FIELDS
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    try:
+        async for clips in _pages_from(first, pages):
+            for clip in clips:
+                row = project(clip, fields)
+                writer.writerow([
+                    json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+                    for value in row.values()
+                ])
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    except Exception as e:
+        # Headers are already sent, end with a marker row so the client knows the export is incomplete
+        writer.writerow(["#error", str(e)])
+        yield buffer.getvalue().encode("utf-8")
@@ -1,17 +1,54 @@
 # -*- coding:utf-8 -*-
 
-from fastapi import FastAPI, HTTPException, status
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, Response, JSONResponse
 
 import schemas
-from suno_client import generate_song, get_feed, get_billing_info, get_session
-from download import download_audio_stream, get_audio_url, get_audio_info
+from suno_client import generate_song, get_feed, get_billing_info, get_session, extract_clips
+from download import download_audio_stream, get_audio_url, audio_info_from_clip
+from bundle import download_bundle
+import profiling
+import admission
+from hedging import hedger
+from admission import admit, DeadlineExceeded
+from scheduler import upstream_scheduler, use_priority
+from conditional import parse_fields, project, check_clip, cached_not_modified
+from library import iter_library_pages, stream_ndjson, stream_csv
+from waveform import waveform_cache, ClipNotReady, MAX_BUCKETS
+from webhook import completion_tracker, webhook_delivery, validate_callback_url
+from prefetch import prefetcher
+from http_session import close_http_session
+from startup import readiness
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up in the background on startup, stop workers and close the pool on shutdown"""
+    readiness.start()
+    yield
+    # Each stop() cancels its tasks and waits for them, nothing may still use the pool below
+    await asyncio.gather(
+        readiness.stop(),
+        completion_tracker.stop(),
+        webhook_delivery.stop(),
+        prefetcher.stop(),
+        return_exceptions=True
+    )
+    await close_http_session()
+
 
 app = FastAPI(
     title="Suno API",
     description="Unofficial Suno API for generating and retrieving songs",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=profiling.ProfiledJSONResponse
 )
 
 app.add_middleware(
@@ -23,6 +60,24 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    """X-Request-Timeout ran out before Suno answered"""
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": str(exc)}
+    )
+
+
+def upstream(priority: str, route: str):
+    """Dependencies of a route that calls Suno: priority lane (scheduler.py) and admission control"""
+    return [Depends(use_priority(priority)), Depends(admit(route))]
+
+
+if profiling.PROFILING_ENABLED:
+    app.middleware("http")(profiling.record_slow_requests)
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -36,12 +91,66 @@ async def root():
 @app.get("/health")
 async def health():
     """Health check endpoint"""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "ready": readiness.ready,
+        "upstream": upstream_scheduler.get_stats(),
+        "admission": admission.get_stats(),
+        "hedging": hedger.get_stats()
+    }
+
+
+@app.get("/health/live")
+async def health_live():
+    """Liveness probe, the process is up and serving"""
+    return {"status": "alive"}
+
 
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness probe, 503 until token, session config and connections are warm"""
+    result = readiness.get_status()
+    if not readiness.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=result)
+    return result
 
-@app.post("/generate", response_model=schemas.Response)
+
+@app.get("/debug/profile", dependencies=[Depends(profiling.require_profiling_token)])
+async def debug_profile(
+    seconds: float = Query(default=10, gt=0, le=profiling.PROFILE_MAX_SECONDS),
+    format: str = Query(default="speedscope", pattern="^(speedscope|collapsed)$")
+):
+    """Sample the live process for N seconds and return a speedscope or folded-stack profile"""
+    samples = await asyncio.to_thread(profiling.sample_stacks, seconds)
+    if format == "collapsed":
+        return PlainTextResponse(profiling.to_collapsed(samples))
+    return profiling.to_speedscope(samples)
+
+
+@app.get("/debug/slow-requests", response_model=schemas.Response,
+         dependencies=[Depends(profiling.require_profiling_token)])
+async def debug_slow_requests(path: str = None, limit: int = Query(default=50, gt=0)):
+    """Recent requests over the slow threshold with their span breakdown"""
+    entries = [e for e in profiling.slow_requests if path is None or e["path"] == path]
+    return schemas.Response(data=entries[-limit:])
+
+
+@app.get("/prefetch/stats", response_model=schemas.Response)
+async def prefetch_stats():
+    """Audio prefetch counters and hit rate"""
+    return schemas.Response(data=prefetcher.get_stats())
+
+
+@app.post("/generate", response_model=schemas.Response, dependencies=upstream("batch", "generate"))
 async def generate(request: schemas.GenerateSongRequest):
     """Generate a song using GPT description"""
+    callback_url = str(request.callback_url) if request.callback_url else None
+    if callback_url:
+        # Checked before spending credits on the generation
+        try:
+            await validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     try:
         result = await generate_song(
             gpt_description_prompt=request.gpt_description_prompt,
@@ -50,7 +159,16 @@ async def generate(request: schemas.GenerateSongRequest):
             mv=request.mv,
             project_id=request.project_id
         )
+        if callback_url or prefetcher.enabled:
+            clip_ids = [clip["id"] for clip in extract_clips(result) if clip.get("id")]
+            completion_tracker.track(
+                clip_ids,
+                callback_url,
+                include_streaming=request.callback_streaming
+            )
         return schemas.Response(data=result)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -58,12 +176,18 @@ async def generate(request: schemas.GenerateSongRequest):
         )
 
 
-@app.post("/feed", response_model=schemas.Response)
-async def feed(request: schemas.GetFeedRequest):
+@app.post("/feed", response_model=schemas.Response, dependencies=upstream("interactive", "feed"))
+async def feed(request: schemas.GetFeedRequest, fields: Optional[str] = None):
     """Get song/clip information by IDs"""
     try:
         result = await get_feed(request.clip_ids)
+        prefetcher.schedule_from_feed(result)
+        field_list = parse_fields(fields)
+        if field_list:
+            result = [project(clip, field_list) for clip in extract_clips(result)]
         return schemas.Response(data=result)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -71,25 +195,49 @@ async def feed(request: schemas.GetFeedRequest):
         )
 
 
-@app.get("/feed/{clip_id}", response_model=schemas.Response)
-async def get_single_feed(clip_id: str):
-    """Get single song/clip information by ID"""
+@app.get("/feed/{clip_id}", response_model=schemas.Response, dependencies=upstream("interactive", "feed"))
+async def get_single_feed(
+    clip_id: str,
+    response: Response,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Get single song/clip information by ID
+
+    Supports If-None-Match (304) and ?fields=status,audio_url projection.
+    """
+    field_list = parse_fields(fields)
+    cached = cached_not_modified("feed", clip_id, field_list, if_none_match)
+    if cached:
+        return cached
     try:
         result = await get_feed([clip_id])
-        return schemas.Response(data=result)
+        prefetcher.schedule_from_feed(result)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+    clips = extract_clips(result)
+    if clips:
+        not_modified = check_clip("feed", clips[0], field_list, if_none_match, response)
+        if not_modified:
+            return not_modified
+    if field_list:
+        result = [project(clip, field_list) for clip in clips]
+    return schemas.Response(data=result)
 
 
-@app.get("/session", response_model=schemas.Response)
+@app.get("/session", response_model=schemas.Response, dependencies=upstream("interactive", "session"))
 async def session():
     """Get session information"""
     try:
         result = await get_session()
         return schemas.Response(data=result)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -97,12 +245,14 @@ async def session():
         )
 
 
-@app.get("/credits", response_model=schemas.Response)
+@app.get("/credits", response_model=schemas.Response, dependencies=upstream("interactive", "credits"))
 async def credits():
     """Get billing/credits information"""
     try:
         result = await get_billing_info()
         return schemas.Response(data=result)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -110,7 +260,21 @@ async def credits():
         )
 
 
-@app.get("/download/{clip_id}")
+@app.post("/download/bundle", dependencies=upstream("batch", "bundle"))
+async def bundle(request: schemas.DownloadBundleRequest):
+    """Download several clips as a single streamed ZIP or TAR archive"""
+    try:
+        return await download_bundle(request.clip_ids, request.format)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@app.get("/download/{clip_id}", dependencies=upstream("interactive", "download"))
 async def download(clip_id: str):
     """Download audio file for a clip ID"""
     try:
@@ -121,7 +285,7 @@ async def download(clip_id: str):
                 detail=f"Audio not found for clip ID: {clip_id}"
             )
         return stream
-    except HTTPException:
+    except (HTTPException, DeadlineExceeded):
         raise
     except Exception as e:
         raise HTTPException(
@@ -130,7 +294,7 @@ async def download(clip_id: str):
         )
 
 
-@app.get("/download-url/{clip_id}", response_model=schemas.Response)
+@app.get("/download-url/{clip_id}", response_model=schemas.Response, dependencies=upstream("interactive", "download-url"))
 async def get_download_url(clip_id: str):
     """Get the direct download URL for a clip ID"""
     try:
@@ -141,7 +305,7 @@ async def get_download_url(clip_id: str):
                 detail=f"Audio URL not found for clip ID: {clip_id}"
             )
         return schemas.Response(data={"audio_url": audio_url, "clip_id": clip_id})
-    except HTTPException:
+    except (HTTPException, DeadlineExceeded):
         raise
     except Exception as e:
         raise HTTPException(
@@ -150,14 +314,101 @@ async def get_download_url(clip_id: str):
         )
 
 
-@app.get("/audio-info/{clip_id}", response_model=schemas.Response)
-async def audio_info(clip_id: str):
-    """Get audio information including URL and metadata"""
+@app.get("/audio-info/{clip_id}", response_model=schemas.Response, dependencies=upstream("interactive", "audio-info"))
+async def audio_info(
+    clip_id: str,
+    response: Response,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """Get audio information including URL and metadata
+
+    Supports If-None-Match (304) and ?fields=status,audio_url projection.
+    """
+    field_list = parse_fields(fields)
+    cached = cached_not_modified("audio-info", clip_id, field_list, if_none_match)
+    if cached:
+        return cached
     try:
-        result = await get_audio_info(clip_id)
-        return schemas.Response(data=result)
+        clips = extract_clips(await get_feed([clip_id]))
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        return schemas.Response(data={"error": str(e)})
+    if not clips:
+        return schemas.Response(data={"error": "Clip not found"})
+    not_modified = check_clip("audio-info", clips[0], field_list, if_none_match, response)
+    if not_modified:
+        return not_modified
+    return schemas.Response(data=project(audio_info_from_clip(clip_id, clips[0]), field_list))
+
+
+@app.get("/audio-info/{clip_id}/waveform", dependencies=upstream("interactive", "waveform"))
+async def audio_waveform(
+    clip_id: str,
+    buckets: int = Query(default=800, ge=1, le=MAX_BUCKETS),
+    format: str = Query(default="json", pattern="^(json|binary)$")
+):
+    """Get waveform peaks (min/max/RMS), duration and loudness for a clip"""
+    try:
+        waveform = await waveform_cache.get(clip_id, buckets)
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ClipNotReady as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
+    if format == "binary":
+        return Response(content=waveform.to_bytes(), media_type="application/octet-stream")
+    return schemas.Response(data={"clip_id": clip_id, **waveform.to_dict()})
+
+
+async def _library_export(stream, media_type: str, filename: str, since: Optional[datetime],
+                          fields: Optional[str], page_size: int, workspace_id: str):
+    pages = iter_library_pages(page_size, workspace_id, since)
+    try:
+        # Fetch the first page up front so upstream errors still get a proper status code
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        first = []
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    return StreamingResponse(
+        stream(first, pages, parse_fields(fields)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/library/export.ndjson", dependencies=upstream("batch", "library"))
+async def library_export_ndjson(
+    since: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    page_size: int = Query(default=20, ge=1, le=100),
+    workspace_id: str = "default"
+):
+    """Stream the whole library as NDJSON, one clip per line"""
+    return await _library_export(stream_ndjson, "application/x-ndjson", "suno-library.ndjson",
+                                 since, fields, page_size, workspace_id)
+
+
+@app.get("/library/export.csv", dependencies=upstream("batch", "library"))
+async def library_export_csv(
+    since: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    page_size: int = Query(default=20, ge=1, le=100),
+    workspace_id: str = "default"
+):
+    """Stream the whole library as CSV"""
+    return await _library_export(stream_csv, "text/csv; charset=utf-8", "suno-library.csv",
+                                 since, fields, page_size, workspace_id)
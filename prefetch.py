@@ -0,0 +1,192 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from auth import get_suno_auth
+from suno_client import extract_clips
+
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+# Comma separated SESSION_IDs that opted in, "*" enables it for every account
+PREFETCH_ACCOUNTS = [a.strip() for a in os.getenv("PREFETCH_ACCOUNTS", "").split(",") if a.strip()]
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# 0 means unlimited
+PREFETCH_MAX_BYTES_PER_SEC = int(os.getenv("PREFETCH_MAX_BYTES_PER_SEC", "0"))
+# Disk budget for stored audio, least recently used clips are evicted past it, 0 means unlimited
+PREFETCH_MAX_BYTES = int(os.getenv("PREFETCH_MAX_BYTES", str(2 * 1024 ** 3)))
+
+
+class AudioStore:
+    """Local directory of downloaded clip audio, one file per clip ID
+
+    A file's mtime is its last use, eviction removes the oldest first.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, clip_id: str) -> str:
+        # Clip IDs are UUIDs, strip anything that could escape the directory
+        safe_id = "".join(c for c in clip_id if c.isalnum() or c in "-_")
+        return os.path.join(self.directory, f"{safe_id}.mp3")
+
+    def has(self, clip_id: str) -> bool:
+        return os.path.isfile(self.path(clip_id))
+
+    def get(self, clip_id: str) -> Optional[str]:
+        """Return the local path if the clip audio is stored, marking it as used"""
+        path = self.path(clip_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def temp_path(self, clip_id: str) -> str:
+        """Path to write to, commit() moves it into place once fully written"""
+        os.makedirs(self.directory, exist_ok=True)
+        return self.path(clip_id) + ".part"
+
+    def commit(self, clip_id: str, tmp_path: str):
+        os.replace(tmp_path, self.path(clip_id))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used clips until the store fits in max_bytes"""
+        if self.max_bytes <= 0:
+            return
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".mp3") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all prefetch downloads"""
+
+    def __init__(self, bytes_per_sec: int):
+        self.rate = bytes_per_sec
+        self.tokens = float(bytes_per_sec)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def consume(self, nbytes: int):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= nbytes
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+
+
+class Prefetcher:
+    """Downloads completed clips in the background so the first /download is a local file"""
+
+    def __init__(self, store: AudioStore):
+        self.store = store
+        self.limiter = BandwidthLimiter(PREFETCH_MAX_BYTES_PER_SEC)
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "scheduled": 0,
+            "completed": 0,
+            "failed": 0,
+            "bytes": 0,
+            "hits": 0,
+            "misses": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return "*" in PREFETCH_ACCOUNTS or get_suno_auth().session_id in PREFETCH_ACCOUNTS
+
+    def schedule(self, clip: Dict[str, Any]):
+        """Queue a clip for prefetch if it is complete and not stored yet"""
+        if not self.enabled or clip.get("status") != "complete":
+            return
+        clip_id = clip.get("id")
+        audio_url = clip.get("audio_url") or clip.get("audioUrl") or clip.get("audio")
+        if not clip_id or not audio_url:
+            return
+        if clip_id in self.inflight or self.store.has(clip_id):
+            return
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        self.stats["scheduled"] += 1
+        task = asyncio.create_task(self._fetch(clip_id, audio_url))
+        self.inflight[clip_id] = task
+        task.add_done_callback(lambda _: self.inflight.pop(clip_id, None))
+
+    async def stop(self):
+        tasks = list(self.inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def schedule_from_feed(self, feed_data: Any):
+        for clip in extract_clips(feed_data):
+            self.schedule(clip)
+
+    async def _fetch(self, clip_id: str, audio_url: str):
+        async with self.semaphore:
+            tmp_path = self.store.temp_path(clip_id)
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(audio_url) as resp:
+                        if resp.status != 200:
+                            raise Exception(f"Failed to prefetch audio: {resp.status}")
+                        with open(tmp_path, "wb") as f:
+                            async for chunk in resp.content.iter_chunked(65536):
+                                await self.limiter.consume(len(chunk))
+                                f.write(chunk)
+                                self.stats["bytes"] += len(chunk)
+                # Directory scan for eviction, keep it off the event loop
+                await asyncio.to_thread(self.store.commit, clip_id, tmp_path)
+                self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Prefetch of {clip_id} failed: {e}")
+            finally:
+                # Also reached on cancellation by stop()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def record_download(self, served_locally: bool):
+        """Count a user download towards the prefetch hit rate"""
+        if not self.enabled:
+            return
+        self.stats["hits" if served_locally else "misses"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "inflight": len(self.inflight),
+            "max_bytes": self.store.max_bytes,
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else None,
+        }
+
+
+# Global prefetcher instance
+audio_store = AudioStore(AUDIO_CACHE_DIR, PREFETCH_MAX_BYTES)
+prefetcher = Prefetcher(audio_store)
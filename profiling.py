@@ -0,0 +1,179 @@
+# -*- coding:utf-8 -*-
+
+import contextlib
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from fastapi import Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "100"))
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 60
+
+# Span totals of the request being handled, None when nothing is recording
+_current_spans: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "current_spans", default=None
+)
+_noop_span = contextlib.nullcontext()
+
+slow_requests: deque = deque(maxlen=SLOW_REQUEST_BUFFER_SIZE)
+
+
+class _Span:
+    def __init__(self, spans: Dict[str, float], name: str):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.spans[self.name] = self.spans.get(self.name, 0.0) + elapsed
+
+
+def span(name: str):
+    """Time a block and add it to the current request's breakdown"""
+    spans = _current_spans.get()
+    if spans is None:
+        return _noop_span
+    return _Span(spans, name)
+
+
+class ProfiledJSONResponse(JSONResponse):
+    """JSONResponse whose encoding shows up as the serialization span"""
+
+    def render(self, content: Any) -> bytes:
+        with span("serialization"):
+            return super().render(content)
+
+
+async def record_slow_requests(request: Request, call_next):
+    """Middleware keeping a span breakdown of requests slower than the threshold
+
+    The request is timed until its body has been sent, so streamed responses
+    include the time spent producing and sending the body.
+    """
+    spans: Dict[str, float] = {}
+    token = _current_spans.set(spans)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current_spans.reset(token)
+    body = response.body_iterator
+
+    async def timed_body():
+        body_start = time.perf_counter()
+        # Upstream calls made by a streaming body record their own spans
+        spans_before = sum(spans.values())
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            elapsed = (time.perf_counter() - body_start) * 1000
+            spans["response_body"] = max(elapsed - (sum(spans.values()) - spans_before), 0.0)
+            _record(request, response.status_code, (time.perf_counter() - start) * 1000, spans)
+
+    response.body_iterator = timed_body()
+    return response
+
+
+def _record(request: Request, status_code: int, total: float, spans: Dict[str, float]):
+    if total < SLOW_REQUEST_THRESHOLD_MS:
+        return
+    breakdown = {name: round(ms, 2) for name, ms in spans.items()}
+    # Routing, validation and handler code
+    breakdown["other"] = round(max(total - sum(spans.values()), 0.0), 2)
+    slow_requests.append({
+        "timestamp": time.time(),
+        "method": request.method,
+        "path": request.url.path,
+        "status_code": status_code,
+        "duration_ms": round(total, 2),
+        "spans": breakdown,
+    })
+
+
+def require_profiling_token(authorization: Optional[str] = Header(default=None)):
+    """Dependency guarding the profiling endpoints"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    expected = f"Bearer {PROFILING_TOKEN}".encode()
+    if not PROFILING_TOKEN or not hmac.compare_digest((authorization or "").encode(), expected):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid profiling token")
+
+
+def sample_stacks(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> Dict[int, List[List[tuple]]]:
+    """Sample the stack of every other thread for `seconds`, blocking the calling thread"""
+    own_id = threading.get_ident()
+    samples: Dict[int, List[List[tuple]]] = {}
+    deadline = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            samples.setdefault(thread_id, []).append(stack)
+        time.sleep(interval)
+    return samples
+
+
+def to_speedscope(samples: Dict[int, List[List[tuple]]], interval: float = PROFILE_SAMPLE_INTERVAL) -> Dict[str, Any]:
+    """Convert sampled stacks to the speedscope file format"""
+    frames: List[Dict[str, Any]] = []
+    frame_index: Dict[tuple, int] = {}
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    profiles = []
+    for thread_id, stacks in samples.items():
+        indexed = []
+        for stack in stacks:
+            row = []
+            for key in stack:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                row.append(frame_index[key])
+            indexed.append(row)
+        weight = interval * 1000
+        profiles.append({
+            "type": "sampled",
+            "name": thread_names.get(thread_id, str(thread_id)),
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": len(indexed) * weight,
+            "samples": indexed,
+            "weights": [weight] * len(indexed),
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+        "name": "suno-api",
+        "exporter": "suno-api",
+    }
+
+
+def to_collapsed(samples: Dict[int, List[List[tuple]]]) -> str:
+    """Convert sampled stacks to folded lines for flamegraph.pl"""
+    counts: Dict[str, int] = {}
+    for stacks in samples.values():
+        for stack in stacks:
+            line = ";".join(f"{name} ({os.path.basename(path)}:{line})" for name, path, line in stack)
+            counts[line] = counts.get(line, 0) + 1
+    return "\n".join(f"{line} {count}" for line, count in counts.items()) + "\n"
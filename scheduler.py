@@ -0,0 +1,153 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import contextlib
+import contextvars
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from fastapi import Header
+
+from admission import DeadlineExceeded, remaining_time
+from profiling import span
+
+# Total concurrent requests to Suno shared by every priority class
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+# name:weight:max_concurrency, comma separated
+PRIORITY_CLASSES = os.getenv("PRIORITY_CLASSES", "interactive:4:8,batch:1:4")
+DEFAULT_PRIORITY = os.getenv("DEFAULT_PRIORITY", "interactive")
+
+current_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_priority", default=DEFAULT_PRIORITY
+)
+
+
+class PriorityClass:
+    def __init__(self, name: str, weight: float, max_concurrency: int):
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.waiters: deque = deque()
+        self.last_tag = 0.0
+        self.active = 0
+        self.completed = 0
+        self.wait_time = 0.0
+
+
+class UpstreamScheduler:
+    """Weighted fair queuing of upstream calls across priority classes
+
+    Every call gets a virtual finish tag of 1/weight after the later of the
+    scheduler clock and its class' previous tag. Free slots go to the lowest
+    tag among classes still under their own concurrency cap.
+    """
+
+    def __init__(self, capacity: int, classes: Dict[str, PriorityClass]):
+        self.capacity = capacity
+        self.classes = classes
+        self.active = 0
+        self.virtual_time = 0.0
+
+    @classmethod
+    def from_config(cls, capacity: int, config: str) -> "UpstreamScheduler":
+        classes = {}
+        for item in config.split(","):
+            name, weight, max_concurrency = item.strip().split(":")
+            classes[name] = PriorityClass(name, float(weight), int(max_concurrency))
+        return cls(capacity, classes)
+
+    def _get_class(self, name: Optional[str]) -> PriorityClass:
+        return self.classes.get(name or current_priority.get()) or self.classes[DEFAULT_PRIORITY]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: Optional[str] = None):
+        """Hold one upstream slot for the duration of the block"""
+        pclass = self._get_class(priority)
+        tag = max(self.virtual_time, pclass.last_tag) + 1 / pclass.weight
+        pclass.last_tag = tag
+        future = asyncio.get_running_loop().create_future()
+        pclass.waiters.append((tag, future))
+        queued_at = time.perf_counter()
+        self._dispatch()
+        try:
+            with span("upstream_queue"):
+                await asyncio.wait_for(asyncio.shield(future), remaining_time())
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                raise DeadlineExceeded("Request deadline exceeded waiting for upstream")
+            # Granted right at the deadline, the call itself will time out
+        except asyncio.CancelledError:
+            # Granted just before we got cancelled, hand the slot back
+            if future.done() and not future.cancelled():
+                self._release(pclass)
+            else:
+                future.cancel()
+            raise
+        pclass.wait_time += time.perf_counter() - queued_at
+        try:
+            yield
+        except asyncio.TimeoutError as e:
+            # The call's client_timeout() was cut short by the request deadline
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded("Request deadline exceeded") from e
+            raise
+        finally:
+            pclass.completed += 1
+            self._release(pclass)
+
+    def _release(self, pclass: PriorityClass):
+        pclass.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.active < self.capacity:
+            eligible = []
+            for pclass in self.classes.values():
+                # Drop waiters whose request went away while queued
+                while pclass.waiters and pclass.waiters[0][1].cancelled():
+                    pclass.waiters.popleft()
+                if pclass.waiters and pclass.active < pclass.max_concurrency:
+                    eligible.append(pclass)
+            if not eligible:
+                return
+            pclass = min(eligible, key=lambda c: c.waiters[0][0])
+            tag, future = pclass.waiters.popleft()
+            self.virtual_time = tag
+            pclass.active += 1
+            self.active += 1
+            future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "classes": {
+                name: {
+                    "weight": pclass.weight,
+                    "max_concurrency": pclass.max_concurrency,
+                    "active": pclass.active,
+                    "queued": sum(1 for _, f in pclass.waiters if not f.cancelled()),
+                    "completed": pclass.completed,
+                    "avg_wait_ms": round(pclass.wait_time / pclass.completed * 1000, 2)
+                    if pclass.completed else None,
+                }
+                for name, pclass in self.classes.items()
+            },
+        }
+
+
+def use_priority(default: str):
+    """Route dependency selecting the priority class, X-Priority overrides it"""
+    async def dependency(x_priority: Optional[str] = Header(default=None)):
+        name = x_priority if x_priority in upstream_scheduler.classes else default
+        current_priority.set(name)
+    return dependency
+
+
+# Global scheduler instance
+upstream_scheduler = UpstreamScheduler.from_config(UPSTREAM_CONCURRENCY, PRIORITY_CLASSES)
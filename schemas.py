@@ -1,7 +1,10 @@
 # -*- coding:utf-8 -*-
 
-from typing import Any, List, Optional
-from pydantic import BaseModel, Field
+from typing import Any, List, Literal, Optional
+from pydantic import BaseModel, Field, HttpUrl
+
+# Every ID goes into a single get_feed call
+MAX_BUNDLE_CLIPS = 100
 
 
 class Response(BaseModel):
@@ -35,6 +38,15 @@ class GenerateSongRequest(BaseModel):
         default=None,
         description="Optional project ID (auto-generated if not provided)",
     )
+    callback_url: Optional[HttpUrl] = Field(
+        default=None,
+        description="Optional http(s) URL that receives a POST when the generated clips finish",
+        example="https://n8n.example.com/webhook/suno"
+    )
+    callback_streaming: bool = Field(
+        default=False,
+        description="Also send an event when clips start streaming",
+    )
 
 
 class GetFeedRequest(BaseModel):
@@ -47,6 +59,22 @@ class GetFeedRequest(BaseModel):
     )
 
 
+class DownloadBundleRequest(BaseModel):
+    """Download several clips as one archive"""
+
+    clip_ids: List[str] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BUNDLE_CLIPS,
+        description=f"List of clip IDs to include in the archive (at most {MAX_BUNDLE_CLIPS})",
+        example=["clip-id-1", "clip-id-2"]
+    )
+    format: Literal["zip", "tar"] = Field(
+        default="zip",
+        description="Archive format",
+    )
+
+
 class GetFeedResponse(BaseModel):
     """Response from feed endpoint"""
     pass  # Will be the actual response from Suno API
@@ -0,0 +1,78 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from auth import get_suno_auth
+from suno_client import get_session_config, get_billing_info
+
+WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+# Without these the first real request would still pay for them
+REQUIRED_STEPS = ("token", "session")
+
+
+class Readiness:
+    """Warms up auth, session config and the connection pool before taking traffic"""
+
+    def __init__(self):
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.attempts = 0
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _step(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+            self.steps[name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            self.steps[name] = {
+                "ok": False,
+                "ms": round((time.perf_counter() - start) * 1000, 2),
+                "error": str(e),
+            }
+
+    async def _run(self):
+        while True:
+            self.attempts += 1
+            # Session and credits wait on the token lock, then run side by side and
+            # leave their connections in the shared pool
+            await asyncio.gather(
+                self._step("token", get_suno_auth().get_token()),
+                self._step("session", get_session_config()),
+                self._step("credits", get_billing_info()),
+            )
+            if all(self.steps[name]["ok"] for name in REQUIRED_STEPS):
+                self.ready_at = time.monotonic()
+                print(f"Ready after {self.ready_at - self.started_at:.2f}s ({self.attempts} attempt(s))")
+                return
+            print(f"Warm-up failed, retrying in {WARMUP_RETRY_INTERVAL}s: {self.steps}")
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "cold_start_seconds": round(self.ready_at - self.started_at, 3) if self.ready else None,
+            "attempts": self.attempts,
+            "steps": self.steps,
+        }
+
+
+# Global readiness instance
+readiness = Readiness()
@@ -1,18 +1,28 @@
 # -*- coding:utf-8 -*-
 
 import json
+import os
+import time
 import uuid
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
-import aiohttp
-
-from auth import suno_auth
+from admission import client_timeout
+from auth import get_suno_auth
+from hedging import hedged
+from http_session import get_http_session
+from profiling import span
+from scheduler import upstream_scheduler
 
 BASE_URL = "https://studio-api.prod.suno.com"
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+
+_session_cache: Dict[str, Any] = {"data": None, "fetched_at": 0.0}
 
 
+@hedged("get_session")
 async def get_session() -> Dict[str, Any]:
     """Get session info from Suno API"""
+    suno_auth = get_suno_auth()
     token = await suno_auth.get_token()
     device_id = suno_auth.get_device_id()
     browser_token = suno_auth.generate_browser_token()
@@ -30,12 +40,22 @@ async def get_session() -> Dict[str, Any]:
         "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
     }
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"{BASE_URL}/api/session/", headers=headers) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Failed to get session: {resp.status} - {error_text}")
-            return await resp.json()
+    async with upstream_scheduler.slot():
+        with span("session"):
+            session = get_http_session()
+            async with session.get(f"{BASE_URL}/api/session/", headers=headers, timeout=client_timeout()) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Failed to get session: {resp.status} - {error_text}")
+                return await resp.json()
+
+
+async def get_session_config() -> Dict[str, Any]:
+    """Session info cached for SESSION_CACHE_TTL seconds, only used for generate defaults"""
+    if _session_cache["data"] is None or time.monotonic() - _session_cache["fetched_at"] > SESSION_CACHE_TTL:
+        _session_cache["data"] = await get_session()
+        _session_cache["fetched_at"] = time.monotonic()
+    return _session_cache["data"]
 
 
 async def generate_song(
@@ -49,13 +69,14 @@ async def generate_song(
     **kwargs
 ) -> Dict[str, Any]:
     """Generate a song using Suno API"""
+    suno_auth = get_suno_auth()
     token = await suno_auth.get_token()
     device_id = suno_auth.get_device_id()
     browser_token = suno_auth.generate_browser_token()
     
     # Get session to get default values
     try:
-        session_data = await get_session()
+        session_data = await get_session_config()
         if not user_tier:
             # Extract user tier from session if available
             roles = session_data.get("roles", {})
@@ -130,16 +151,20 @@ async def generate_song(
     
     url = f"{BASE_URL}{gen_endpoint}"
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Failed to generate song: {resp.status} - {error_text}")
-            return await resp.json()
+    async with upstream_scheduler.slot():
+        with span("upstream"):
+            session = get_http_session()
+            async with session.post(url, headers=headers, json=payload, timeout=client_timeout()) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Failed to generate song: {resp.status} - {error_text}")
+                return await resp.json()
 
 
+@hedged("get_feed")
 async def get_feed(clip_ids: list) -> Dict[str, Any]:
     """Get feed/clip information by IDs"""
+    suno_auth = get_suno_auth()
     token = await suno_auth.get_token()
     device_id = suno_auth.get_device_id()
     browser_token = suno_auth.generate_browser_token()
@@ -161,16 +186,68 @@ async def get_feed(clip_ids: list) -> Dict[str, Any]:
     
     url = f"{BASE_URL}/api/feed/?ids={ids_str}"
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Failed to get feed: {resp.status} - {error_text}")
-            return await resp.json()
+    async with upstream_scheduler.slot():
+        with span("upstream"):
+            session = get_http_session()
+            async with session.get(url, headers=headers, timeout=client_timeout()) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Failed to get feed: {resp.status} - {error_text}")
+                return await resp.json()
+
+
+async def get_feed_v3(
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    workspace_id: str = "default"
+) -> Dict[str, Any]:
+    """Get one page of the library (newest first), follow next_cursor while has_more"""
+    suno_auth = get_suno_auth()
+    token = await suno_auth.get_token()
+    device_id = suno_auth.get_device_id()
+    browser_token = suno_auth.generate_browser_token()
+    
+    headers = {
+        "accept": "*/*",
+        "accept-language": "en-US,en;q=0.9",
+        "authorization": f"Bearer {token}",
+        "browser-token": browser_token,
+        "cache-control": "no-cache",
+        "content-type": "application/json",
+        "device-id": device_id,
+        "origin": "https://suno.com",
+        "pragma": "no-cache",
+        "referer": "https://suno.com/",
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+    }
+    
+    payload = {
+        "cursor": cursor,
+        "limit": limit,
+        "filters": {
+            "disliked": "False",
+            "trashed": "False",
+            "stem": {"presence": "False"},
+            "workspace": {"presence": "True", "workspaceId": workspace_id},
+        },
+    }
+    
+    url = f"{BASE_URL}/api/feed/v3"
+    
+    async with upstream_scheduler.slot():
+        with span("upstream"):
+            session = get_http_session()
+            async with session.post(url, headers=headers, json=payload, timeout=client_timeout()) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Failed to get library page: {resp.status} - {error_text}")
+                return await resp.json()
 
 
+@hedged("get_billing_info")
 async def get_billing_info() -> Dict[str, Any]:
     """Get billing/credits information"""
+    suno_auth = get_suno_auth()
     token = await suno_auth.get_token()
     device_id = suno_auth.get_device_id()
     browser_token = suno_auth.generate_browser_token()
@@ -190,10 +267,25 @@ async def get_billing_info() -> Dict[str, Any]:
     
     url = f"{BASE_URL}/api/billing/info/"
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Failed to get billing info: {resp.status} - {error_text}")
-            return await resp.json()
+    async with upstream_scheduler.slot():
+        with span("upstream"):
+            session = get_http_session()
+            async with session.get(url, headers=headers, timeout=client_timeout()) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"Failed to get billing info: {resp.status} - {error_text}")
+                return await resp.json()
+
+
 
+def extract_clips(feed_data: Any) -> List[Dict[str, Any]]:
+    """Normalize a feed/generate response into a list of clip dicts"""
+    if isinstance(feed_data, list):
+        return [clip for clip in feed_data if isinstance(clip, dict)]
+    if isinstance(feed_data, dict):
+        clips = feed_data.get("clips")
+        if isinstance(clips, list):
+            return [clip for clip in clips if isinstance(clip, dict)]
+        if feed_data.get("id"):
+            return [feed_data]
+    return []
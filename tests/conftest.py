@@ -0,0 +1,11 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop"""
+    return asyncio.run
@@ -0,0 +1,178 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import RouteLimiter
+
+
+def test_acquire_within_capacity_is_immediate(run):
+    async def main():
+        limiter = RouteLimiter("test", 2, 2)
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+        assert limiter.active == 2
+        assert limiter.admitted == 2
+        assert not limiter.waiters
+    run(main())
+
+
+def test_release_hands_slot_to_next_waiter(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1
+        assert not waiter.done()
+
+        limiter.release(0.1)
+        await waiter
+        # The slot moved to the waiter without ever becoming free
+        assert limiter.active == 1
+        assert limiter.admitted == 2
+        assert not limiter.waiters
+
+        limiter.release(0.1)
+        assert limiter.active == 0
+    run(main())
+
+
+def test_waiters_are_served_in_order(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 4)
+        await limiter.acquire(1)
+        order = []
+
+        async def wait(name):
+            await limiter.acquire(10)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(wait(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        for _ in range(3):
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+    run(main())
+
+
+def test_rejects_when_queue_is_full(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 1)
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc:
+            await limiter.acquire(1)
+        assert exc.value.status_code == 503
+        assert int(exc.value.headers["Retry-After"]) >= 1
+        assert limiter.rejected == 1
+        limiter.release()
+        await waiter
+    run(main())
+
+
+def test_rejects_when_expected_wait_is_too_long(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 10)
+        limiter.avg_service_time = 5.0
+        await limiter.acquire(1)
+        with pytest.raises(HTTPException) as exc:
+            await limiter.acquire(1)
+        assert exc.value.status_code == 503
+        # Rejected up front, nothing was queued
+        assert not limiter.waiters
+    run(main())
+
+
+def test_rejects_after_timing_out_in_queue(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        limiter.avg_service_time = 0.01
+        await limiter.acquire(1)
+        with pytest.raises(HTTPException) as exc:
+            await limiter.acquire(0.05)
+        assert exc.value.status_code == 503
+        assert not limiter.waiters
+        # A later release must not hand the slot to the timed out waiter
+        limiter.release()
+        assert limiter.active == 0
+    run(main())
+
+
+def test_slot_granted_at_the_deadline_is_kept(monkeypatch, run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        await limiter.acquire(1)
+
+        async def granted_then_timeout(awaitable, timeout):
+            # The holder releases right as the waiter's timeout fires
+            limiter.release()
+            awaitable.cancel()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", granted_then_timeout)
+        await limiter.acquire(1)
+        assert limiter.active == 1
+        assert limiter.rejected == 0
+        assert not limiter.waiters
+    run(main())
+
+
+def test_cancelled_waiter_gives_up_its_place(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not limiter.waiters
+        limiter.release()
+        assert limiter.active == 0
+    run(main())
+
+
+def test_cancel_racing_a_grant_does_not_leak_the_slot(run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        # Slot is handed over and the waiter is cancelled before it resumes
+        limiter.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        else:
+            # Some Python versions let the grant win, the caller then owns the slot
+            limiter.release()
+        assert limiter.active == 0
+        assert not limiter.waiters
+    run(main())
+
+
+def test_cancelled_after_grant_releases_the_slot(monkeypatch, run):
+    async def main():
+        limiter = RouteLimiter("test", 1, 2)
+        await limiter.acquire(1)
+
+        async def granted_then_cancelled(awaitable, timeout):
+            limiter.release()
+            awaitable.cancel()
+            raise asyncio.CancelledError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", granted_then_cancelled)
+        with pytest.raises(asyncio.CancelledError):
+            await limiter.acquire(1)
+        # The handed over slot went back instead of leaking
+        assert limiter.active == 0
+    run(main())
@@ -0,0 +1,177 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+
+import bundle
+from bundle import ZipStreamWriter, stream_bundle
+from prefetch import AudioStore
+
+
+@pytest.fixture
+def stored_clips(tmp_path, monkeypatch):
+    """Two clips in a local audio store, the bundle reads them instead of the CDN"""
+    store = AudioStore(str(tmp_path))
+    audio = {"a": b"A" * 100000, "b": b"B" * 10}
+    for clip_id, data in audio.items():
+        tmp = store.temp_path(clip_id)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        store.commit(clip_id, tmp)
+    monkeypatch.setattr(bundle, "audio_store", store)
+    return audio
+
+
+def collect(clips, clip_ids, archive_format):
+    async def main():
+        return b"".join([chunk async for chunk in stream_bundle(clips, clip_ids, archive_format)])
+    return asyncio.run(main())
+
+
+CLIPS = [
+    {"id": "a", "title": "First", "status": "complete"},
+    {"id": "b", "title": "Second", "status": "complete"},
+]
+
+
+def test_streamed_zip_opens_with_zipfile(stored_clips):
+    data = collect(CLIPS, ["a", "b", "missing"], "zip")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("a.mp3") == stored_clips["a"]
+        assert archive.read("b.mp3") == stored_clips["b"]
+        manifest = json.loads(archive.read("manifest.json"))
+    errors = {clip["clip_id"]: clip["error"] for clip in manifest["clips"]}
+    assert errors["a"] is None
+    assert errors["missing"]
+
+
+def test_streamed_tar_opens_with_tarfile(stored_clips):
+    data = collect(CLIPS, ["a", "b"], "tar")
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert archive.extractfile("a.mp3").read() == stored_clips["a"]
+        assert archive.extractfile("b.mp3").read() == stored_clips["b"]
+        manifest = json.loads(archive.extractfile("manifest.json").read())
+    assert {clip["clip_id"]: clip["size"] for clip in manifest["clips"]} == {"a": 100000, "b": 10}
+
+
+def test_zip_entry_of_unknown_size_uses_zip64():
+    writer = ZipStreamWriter()
+    data = writer.start_entry("stream.mp3") + writer.write(b"x" * 1000) + writer.end_entry()
+    data += writer.start_entry("known.mp3", 3) + writer.write(b"abc") + writer.end_entry()
+    data += writer.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.read("stream.mp3") == b"x" * 1000
+        assert archive.read("known.mp3") == b"abc"
+        for info in archive.infolist():
+            assert info.create_system == 3
+            assert info.external_attr >> 16 == 0o100644
+
+
+def test_zip_with_more_than_65535_entries():
+    writer = ZipStreamWriter()
+    parts = []
+    count = 0x10000 + 5
+    for i in range(count):
+        parts += [writer.start_entry(f"{i}.txt", 1), writer.write(b"x"), writer.end_entry()]
+    parts.append(writer.close())
+    with zipfile.ZipFile(io.BytesIO(b"".join(parts))) as archive:
+        names = archive.namelist()
+        assert len(names) == count
+        assert archive.read(names[-1]) == b"x"
+
+
+AUDIO_CHUNKS = 32
+
+
+@pytest.fixture
+def chunked_server():
+    """Local HTTP server that sends audio without a Content-Length, like a streaming clip"""
+    from aiohttp import web
+
+    async def audio(request):
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        # Several times the per-clip queue, so a skipped source is left blocked on a full queue
+        for _ in range(AUDIO_CHUNKS):
+            await response.write(b"z" * 65536)
+        await response.write_eof()
+        return response
+
+    class Server:
+        async def __aenter__(self):
+            app = web.Application()
+            app.router.add_get("/{clip_id}.mp3", audio)
+            self.runner = web.AppRunner(app)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, "127.0.0.1", 0)
+            await site.start()
+            port = self.runner.addresses[0][1]
+            self.url = f"http://127.0.0.1:{port}"
+            return self
+
+        async def __aexit__(self, *exc):
+            await self.runner.cleanup()
+
+    return Server
+
+
+def unknown_size_clips(url: str, count: int):
+    return [
+        {"id": f"c{i}", "status": "complete", "audio_url": f"{url}/c{i}.mp3"}
+        for i in range(count)
+    ]
+
+
+def test_tar_skips_unknown_sizes_without_hanging(run, chunked_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(bundle, "audio_store", AudioStore(str(tmp_path)))
+    monkeypatch.setattr(bundle, "BUNDLE_CONCURRENCY", 2)
+
+    async def main():
+        async with chunked_server() as server:
+            clips = unknown_size_clips(server.url, 6)
+            stream = stream_bundle(clips, [clip["id"] for clip in clips], "tar")
+            chunks = [chunk async for chunk in stream]
+            return b"".join(chunks)
+
+    data = run(asyncio.wait_for(main(), 10))
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        assert archive.getnames() == ["manifest.json"]
+        manifest = json.loads(archive.extractfile("manifest.json").read())
+    assert len(manifest["clips"]) == 6
+    assert all(clip["error"] == "Unknown content length" for clip in manifest["clips"])
+
+
+def test_zip_streams_unknown_sizes(run, chunked_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(bundle, "audio_store", AudioStore(str(tmp_path)))
+    monkeypatch.setattr(bundle, "BUNDLE_CONCURRENCY", 2)
+
+    async def main():
+        async with chunked_server() as server:
+            clips = unknown_size_clips(server.url, 6)
+            stream = stream_bundle(clips, [clip["id"] for clip in clips], "zip")
+            return b"".join([chunk async for chunk in stream])
+
+    data = run(asyncio.wait_for(main(), 10))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert len(archive.namelist()) == 7
+        assert archive.read("c5.mp3") == b"z" * 65536 * AUDIO_CHUNKS
+
+
+def test_unfinished_clips_are_flagged(run, stored_clips):
+    clips = [{"id": "a", "status": "complete"}, {"id": "b", "status": "streaming"}]
+    data = collect(clips, ["a", "b"], "zip")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert "b.mp3" not in archive.namelist()
+        manifest = json.loads(archive.read("manifest.json"))
+    errors = {clip["clip_id"]: clip["error"] for clip in manifest["clips"]}
+    assert errors["a"] is None
+    assert "not complete" in errors["b"]
@@ -0,0 +1,47 @@
+# -*- coding:utf-8 -*-
+
+import conditional
+from conditional import ClipStateCache, make_etag, parse_fields, project
+
+CLIP = {"id": "a", "status": "complete", "metadata": {"tags": "rock", "duration": 120}}
+
+
+def test_parse_fields_keeps_order_and_drops_duplicates():
+    assert parse_fields("status, id,status,,") == ["status", "id"]
+    assert parse_fields("") is None
+    assert parse_fields(" , ") is None
+
+
+def test_project_reaches_into_nested_objects():
+    assert project(CLIP, ["id", "metadata.tags", "metadata.missing", "status.x"]) == {
+        "id": "a",
+        "metadata.tags": "rock",
+        "metadata.missing": None,
+        "status.x": None,
+    }
+    assert project(CLIP, None) is CLIP
+
+
+def test_etag_does_not_depend_on_field_order():
+    assert make_etag("feed", "h", ["id", "status"]) == make_etag("feed", "h", ["status", "id"])
+    assert make_etag("feed", "h", ["id"]) != make_etag("feed", "h", None)
+
+
+def test_terminal_state_is_trusted_only_within_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(conditional.time, "monotonic", lambda: now[0])
+    cache = ClipStateCache(10, ttl=60)
+    clip_hash = cache.update(CLIP)
+    assert cache.terminal_hash("a") == clip_hash
+
+    now[0] += 61
+    assert cache.terminal_hash("a") is None
+    # A fresh upstream fetch starts the TTL again
+    cache.update(CLIP)
+    assert cache.terminal_hash("a") == clip_hash
+
+
+def test_unfinished_state_is_never_trusted():
+    cache = ClipStateCache(10, ttl=60)
+    cache.update({"id": "b", "status": "streaming"})
+    assert cache.terminal_hash("b") is None
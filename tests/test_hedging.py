@@ -0,0 +1,157 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+
+import pytest
+
+import hedging
+from hedging import HedgedOperation, Hedger
+
+
+@pytest.fixture(autouse=True)
+def hedge_config(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_MIN_DELAY_MS", 1)
+    monkeypatch.setattr(hedging, "HEDGE_BUDGET", 0.1)
+
+
+def warmed_up(hedger: Hedger, name: str, latency: float = 0.01) -> HedgedOperation:
+    """Give the operation enough history that it hedges after ~latency"""
+    op = hedger._get_operation(name)
+    op.latencies.extend([latency] * hedging.HEDGE_MIN_SAMPLES)
+    op.recent_hedges.extend([False] * 10)
+    return op
+
+
+class Attempts:
+    """Attempt factory, each call takes the next delay and records how it ended"""
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.started = 0
+        self.cancelled = []
+
+    async def __call__(self):
+        index = self.started
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delays[index])
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        if self.error is not None:
+            raise self.error
+        return index
+
+
+def test_no_hedge_without_enough_samples(run):
+    async def main():
+        hedger = Hedger()
+        attempts = Attempts(0.05)
+        assert await hedger.run("op", attempts) == 0
+        assert attempts.started == 1
+        assert hedger.operations["op"].hedged == 0
+    run(main())
+
+
+def test_fast_primary_is_not_hedged(run):
+    async def main():
+        hedger = Hedger()
+        warmed_up(hedger, "op", latency=0.05)
+        attempts = Attempts(0.001)
+        assert await hedger.run("op", attempts) == 0
+        assert attempts.started == 1
+    run(main())
+
+
+def test_hedge_wins_and_loser_is_cancelled(run):
+    async def main():
+        hedger = Hedger()
+        op = warmed_up(hedger, "op")
+        attempts = Attempts(1.0, 0.001)
+        assert await hedger.run("op", attempts) == 1
+        await asyncio.sleep(0)
+        assert attempts.started == 2
+        assert attempts.cancelled == [0]
+        assert op.hedged == 1
+        assert op.hedge_wins == 1
+    run(main())
+
+
+def test_primary_can_still_win_after_hedging(run):
+    async def main():
+        hedger = Hedger()
+        op = warmed_up(hedger, "op")
+        attempts = Attempts(0.03, 1.0)
+        assert await hedger.run("op", attempts) == 0
+        await asyncio.sleep(0)
+        assert attempts.cancelled == [1]
+        assert op.hedged == 1
+        assert op.hedge_wins == 0
+    run(main())
+
+
+def test_budget_limits_hedges(run):
+    async def main():
+        hedger = Hedger()
+        op = warmed_up(hedger, "op")
+        # 0 of 10 recent calls hedged: one more fits a 10% budget, a second does not
+        assert op.within_budget()
+        await hedger.run("op", Attempts(0.05, 0.001))
+        assert op.hedged == 1
+        assert not op.within_budget()
+
+        attempts = Attempts(0.05, 0.001)
+        assert await hedger.run("op", attempts) == 0
+        assert attempts.started == 1
+        assert op.hedged == 1
+    run(main())
+
+
+def test_budget_never_overshoots():
+    op = HedgedOperation("op")
+    hedges = 0
+    for _ in range(1000):
+        if op.within_budget():
+            op.recent_hedges.append(True)
+            hedges += 1
+        else:
+            op.recent_hedges.append(False)
+        assert sum(op.recent_hedges) <= hedging.HEDGE_BUDGET * len(op.recent_hedges)
+    assert hedges > 0
+
+
+def test_error_raised_when_both_attempts_fail(run):
+    async def main():
+        hedger = Hedger()
+        warmed_up(hedger, "op")
+        attempts = Attempts(0.03, 0.001, error=ValueError("upstream down"))
+        with pytest.raises(ValueError):
+            await hedger.run("op", attempts)
+        assert attempts.started == 2
+    run(main())
+
+
+def test_caller_cancellation_cancels_both_attempts(run):
+    async def main():
+        hedger = Hedger()
+        warmed_up(hedger, "op")
+        attempts = Attempts(1.0, 1.0)
+        call = asyncio.ensure_future(hedger.run("op", attempts))
+        await asyncio.sleep(0.05)
+        assert attempts.started == 2
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        assert sorted(attempts.cancelled) == [0, 1]
+    run(main())
+
+
+def test_decorator_is_a_no_op_when_disabled(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGING_ENABLED", False)
+
+    async def fetch():
+        return 1
+
+    assert hedging.hedged("op")(fetch) is fetch
@@ -0,0 +1,40 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import csv
+import io
+import json
+
+from library import stream_csv, stream_ndjson
+
+FIRST = [{"id": "a", "title": "One", "metadata": {"tags": "rock"}}]
+
+
+async def failing_pages():
+    yield [{"id": "b", "title": "Two", "metadata": {"tags": "jazz"}}]
+    raise Exception("upstream down")
+
+
+def collect(stream):
+    async def main():
+        return b"".join([chunk async for chunk in stream]).decode("utf-8")
+    return asyncio.run(main())
+
+
+def test_csv_rows_follow_field_order():
+    text = collect(stream_csv(FIRST, failing_pages(), ["metadata.tags", "id"]))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[:3] == [["metadata.tags", "id"], ["rock", "a"], ["jazz", "b"]]
+
+
+def test_csv_ends_with_error_row_when_a_page_fails():
+    text = collect(stream_csv(FIRST, failing_pages(), ["id"]))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[-1] == ["#error", "upstream down"]
+
+
+def test_ndjson_ends_with_error_line_when_a_page_fails():
+    text = collect(stream_ndjson(FIRST, failing_pages(), ["id", "metadata.tags"]))
+    lines = [json.loads(line) for line in text.splitlines()]
+    assert lines[0] == {"id": "a", "metadata.tags": "rock"}
+    assert lines[-1] == {"error": "upstream down"}
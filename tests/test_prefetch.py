@@ -0,0 +1,32 @@
+# -*- coding:utf-8 -*-
+
+import os
+
+from prefetch import AudioStore
+
+
+def store_clip(store: AudioStore, clip_id: str, size: int, used_at: float):
+    tmp_path = store.temp_path(clip_id)
+    with open(tmp_path, "wb") as f:
+        f.write(b"x" * size)
+    store.commit(clip_id, tmp_path)
+    os.utime(store.path(clip_id), (used_at, used_at))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    store = AudioStore(str(tmp_path), max_bytes=250)
+    store_clip(store, "a", 100, 1000)
+    store_clip(store, "b", 100, 1001)
+    # Reading a marks it as used, so b is now the oldest
+    assert store.get("a")
+    store_clip(store, "c", 100, 2000)
+    assert store.has("a")
+    assert not store.has("b")
+    assert store.has("c")
+
+
+def test_unlimited_store_keeps_everything(tmp_path):
+    store = AudioStore(str(tmp_path))
+    for i in range(5):
+        store_clip(store, str(i), 100, 1000 + i)
+    assert all(store.has(str(i)) for i in range(5))
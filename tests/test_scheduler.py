@@ -0,0 +1,169 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+
+import scheduler
+from admission import DeadlineExceeded, request_deadline
+from scheduler import PriorityClass, UpstreamScheduler
+
+
+def make_scheduler(capacity, interactive=(4, 8), batch=(1, 8)):
+    return UpstreamScheduler(capacity, {
+        "interactive": PriorityClass("interactive", *interactive),
+        "batch": PriorityClass("batch", *batch),
+    })
+
+
+async def hold(sched, priority, release: asyncio.Event, started=None):
+    async with sched.slot(priority):
+        if started is not None:
+            started.append(priority)
+        await release.wait()
+
+
+def test_wfq_shares_slots_by_weight(run):
+    async def main():
+        sched = make_scheduler(1)
+        release = asyncio.Event()
+        blocker = asyncio.ensure_future(hold(sched, "interactive", release))
+        await asyncio.sleep(0)
+
+        order = []
+
+        async def call(priority):
+            async with sched.slot(priority):
+                order.append(priority)
+
+        tasks = [asyncio.ensure_future(call("batch")) for _ in range(8)]
+        tasks += [asyncio.ensure_future(call("interactive")) for _ in range(8)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+        # Both classes backlogged: four interactive calls per batch call,
+        # and batch is not starved until interactive drains
+        assert order[:5].count("batch") == 1
+        assert order[:10].count("batch") == 2
+        assert order.index("batch") < 5
+        assert sched.active == 0
+    run(main())
+
+
+def test_class_cap_limits_concurrency_below_capacity(run):
+    async def main():
+        sched = make_scheduler(4, batch=(1, 1))
+        release = asyncio.Event()
+        started = []
+        tasks = [asyncio.ensure_future(hold(sched, "batch", release, started)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert started == ["batch"]
+        assert sched.classes["batch"].active == 1
+        assert len(sched.classes["batch"].waiters) == 2
+
+        # Free capacity still goes to the other class
+        tasks.append(asyncio.ensure_future(hold(sched, "interactive", release, started)))
+        await asyncio.sleep(0)
+        assert started == ["batch", "interactive"]
+
+        release.set()
+        await asyncio.gather(*tasks)
+        assert started.count("batch") == 3
+        assert sched.active == 0
+    run(main())
+
+
+def test_priority_defaults_to_context(run):
+    async def main():
+        sched = make_scheduler(1)
+        scheduler.current_priority.set("batch")
+        async with sched.slot():
+            assert sched.classes["batch"].active == 1
+        assert sched.classes["batch"].completed == 1
+    run(main())
+
+
+def test_deadline_while_queued_raises_and_frees_the_place(run):
+    async def main():
+        sched = make_scheduler(1)
+        release = asyncio.Event()
+        blocker = asyncio.ensure_future(hold(sched, "interactive", release))
+        await asyncio.sleep(0)
+
+        request_deadline.set(time.monotonic() + 0.05)
+        with pytest.raises(DeadlineExceeded):
+            async with sched.slot("interactive"):
+                pass
+        request_deadline.set(None)
+
+        release.set()
+        await blocker
+        assert sched.active == 0
+        assert sched.get_stats()["classes"]["interactive"]["queued"] == 0
+    run(main())
+
+
+def test_slot_granted_at_the_deadline_is_used(monkeypatch, run):
+    async def main():
+        sched = make_scheduler(1)
+        pclass = sched.classes["interactive"]
+        # Pretend another call holds the only slot
+        sched.active = pclass.active = 1
+
+        async def granted_then_timeout(awaitable, timeout):
+            sched._release(pclass)
+            awaitable.cancel()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(scheduler.asyncio, "wait_for", granted_then_timeout)
+        entered = False
+        async with sched.slot("interactive"):
+            entered = True
+            assert sched.active == 1
+        assert entered
+        assert sched.active == 0
+    run(main())
+
+
+def test_upstream_timeout_past_deadline_becomes_deadline_exceeded(run):
+    async def main():
+        sched = make_scheduler(1)
+        request_deadline.set(time.monotonic() + 0.05)
+        with pytest.raises(DeadlineExceeded):
+            async with sched.slot("interactive"):
+                await asyncio.wait_for(asyncio.sleep(1), 0.05)
+        assert sched.active == 0
+    run(main())
+
+
+def test_upstream_timeout_without_deadline_is_left_alone(run):
+    async def main():
+        sched = make_scheduler(1)
+        with pytest.raises(asyncio.TimeoutError):
+            async with sched.slot("interactive"):
+                await asyncio.wait_for(asyncio.sleep(1), 0.01)
+        assert sched.active == 0
+    run(main())
+
+
+def test_cancelled_waiter_is_skipped(run):
+    async def main():
+        sched = make_scheduler(1)
+        release = asyncio.Event()
+        blocker = asyncio.ensure_future(hold(sched, "interactive", release))
+        await asyncio.sleep(0)
+        started = []
+        waiter = asyncio.ensure_future(hold(sched, "batch", release, started))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        release.set()
+        await blocker
+        assert started == []
+        assert sched.active == 0
+        assert sched.classes["batch"].active == 0
+    run(main())
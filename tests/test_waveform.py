@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import waveform
+from admission import DeadlineExceeded, request_deadline
+from prefetch import AudioStore
+from scheduler import current_priority
+from waveform import Waveform, WaveformCache
+
+
+def sine_pcm(seconds: float = 1.0, amplitude: float = 0.5) -> np.ndarray:
+    t = np.arange(int(waveform.SAMPLE_RATE * seconds)) / waveform.SAMPLE_RATE
+    return np.round(np.sin(2 * np.pi * 440 * t) * amplitude * 32767).astype(np.int16)
+
+
+def test_from_pcm_peaks_and_loudness():
+    wf = Waveform.from_pcm(sine_pcm(), buckets=100)
+    assert wf.mins.size == wf.maxs.size == wf.rms.size == 100
+    assert wf.duration == pytest.approx(1.0)
+    assert wf.maxs.max() == pytest.approx(0.5 * 32767, rel=0.01)
+    assert wf.mins.min() == pytest.approx(-0.5 * 32767, rel=0.01)
+    # RMS of a sine is peak / sqrt(2)
+    assert np.median(wf.rms) == pytest.approx(0.5 / np.sqrt(2) * 32767, rel=0.02)
+    assert wf.peak_db == pytest.approx(20 * np.log10(0.5), abs=0.1)
+    assert wf.rms_db == pytest.approx(20 * np.log10(0.5 / np.sqrt(2)), abs=0.1)
+
+
+def test_from_pcm_caps_buckets_at_sample_count():
+    wf = Waveform.from_pcm(np.array([100, -200, 300], dtype=np.int16), buckets=10)
+    assert wf.mins.size == 3
+
+
+def test_from_pcm_rejects_empty_audio():
+    with pytest.raises(Exception):
+        Waveform.from_pcm(np.array([], dtype=np.int16))
+
+
+def test_silence_is_floor_db():
+    wf = Waveform.from_pcm(np.zeros(1000, dtype=np.int16), buckets=10)
+    assert wf.peak_db == wf.rms_db == -120.0
+
+
+def test_resample_merges_buckets():
+    wf = Waveform(
+        np.array([-1, -5, -2, -3], dtype=np.int16),
+        np.array([4, 2, 8, 1], dtype=np.int16),
+        np.array([3, 4, 0, 0], dtype=np.int16),
+        duration=1.0, rms_db=-10.0, peak_db=-1.0,
+    )
+    merged = wf.resample(2)
+    assert merged.mins.tolist() == [-5, -3]
+    assert merged.maxs.tolist() == [4, 8]
+    # Energy is averaged: sqrt((9 + 16) / 2)
+    assert merged.rms.tolist() == [round(np.sqrt(12.5)), 0]
+    assert wf.resample(4) is wf
+    assert wf.resample(10) is wf
+
+
+def test_binary_round_trip():
+    wf = Waveform.from_pcm(sine_pcm(0.5), buckets=64)
+    restored = Waveform.from_bytes(wf.to_bytes())
+    assert restored.mins.tolist() == wf.mins.tolist()
+    assert restored.maxs.tolist() == wf.maxs.tolist()
+    assert restored.rms.tolist() == wf.rms.tolist()
+    assert restored.duration == pytest.approx(wf.duration)
+    assert restored.rms_db == pytest.approx(wf.rms_db, abs=1e-4)
+    assert restored.sample_rate == wf.sample_rate
+    assert len(wf.to_bytes()) == waveform.HEADER.size + 3 * 64 * 2
+
+
+def test_from_bytes_rejects_other_files():
+    with pytest.raises(ValueError):
+        Waveform.from_bytes(b"XXXX" + bytes(waveform.HEADER.size))
+
+
+def test_shared_decode_ignores_first_callers_deadline(run, tmp_path, monkeypatch):
+    seen = {}
+
+    async def fake_get_feed(clip_ids):
+        seen["deadline"] = request_deadline.get()
+        seen["priority"] = current_priority.get()
+        await asyncio.sleep(0.1)
+        return [{"id": clip_ids[0], "status": "complete", "audio_url": "https://cdn/a.mp3"}]
+
+    async def fake_decode(source):
+        return sine_pcm(0.1)
+
+    monkeypatch.setattr(waveform, "get_feed", fake_get_feed)
+    monkeypatch.setattr(waveform, "decode_pcm", fake_decode)
+    monkeypatch.setattr(waveform, "audio_store", AudioStore(str(tmp_path / "audio")))
+    cache = WaveformCache(str(tmp_path / "waveforms"), 4)
+
+    async def impatient():
+        request_deadline.set(time.monotonic() + 0.02)
+        current_priority.set("batch")
+        return await cache.get("clip", 10)
+
+    async def patient():
+        await asyncio.sleep(0)
+        return await cache.get("clip", 10)
+
+    async def main():
+        return await asyncio.gather(impatient(), patient(), return_exceptions=True)
+
+    first, second = run(main())
+    assert isinstance(first, DeadlineExceeded)
+    assert isinstance(second, Waveform)
+    assert seen == {"deadline": None, "priority": "interactive"}
@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import hashlib
+import hmac
+import json
+
+import pytest
+
+import webhook
+from webhook import (
+    CompletionTracker, PublicResolver, WebhookDelivery,
+    is_public_address, sign_payload, validate_callback_url,
+)
+
+
+class RecordingDelivery:
+    def __init__(self):
+        self.events = []
+
+    def enqueue(self, callback_url, event):
+        self.events.append((callback_url, event))
+
+
+class NoPrefetch:
+    def schedule(self, clip):
+        pass
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(webhook, "prefetcher", NoPrefetch())
+    return CompletionTracker(RecordingDelivery())
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.1.2.3", "172.16.0.1", "192.168.1.1", "169.254.169.254",
+    "::1", "fe80::1", "::ffff:127.0.0.1", "::ffff:10.0.0.1", "0.0.0.0", "224.0.0.1",
+])
+def test_internal_addresses_are_not_public(address):
+    assert not is_public_address(address)
+
+
+@pytest.mark.parametrize("address", ["8.8.8.8", "1.1.1.1", "2606:4700:4700::1111"])
+def test_public_addresses(address):
+    assert is_public_address(address)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:5678/webhook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://[::ffff:192.168.0.1]/hook",
+    "http://localhost:5678/hook",
+])
+def test_validate_rejects_internal_targets(run, url):
+    with pytest.raises(ValueError):
+        run(validate_callback_url(url))
+
+
+def test_validate_accepts_public_ip(run):
+    run(validate_callback_url("https://8.8.8.8/hook"))
+
+
+def test_allow_private_bypasses_the_checks(run, monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_ALLOW_PRIVATE", True)
+    run(validate_callback_url("http://127.0.0.1:5678/webhook"))
+
+    async def main():
+        delivery = WebhookDelivery()
+        session = delivery._get_session()
+        assert not isinstance(session.connector._resolver, PublicResolver)
+        await delivery.stop()
+    run(main())
+
+
+def test_resolver_drops_internal_addresses(run):
+    async def main():
+        with pytest.raises(OSError):
+            await PublicResolver().resolve("localhost", 80)
+    run(main())
+
+
+def test_signature_covers_timestamp_and_body():
+    body = b'{"events": []}'
+    expected = hmac.new(b"secret", b"1700000000." + body, hashlib.sha256).hexdigest()
+    assert sign_payload(body, "1700000000", "secret") == expected
+    assert sign_payload(body, "1700000001", "secret") != expected
+    assert sign_payload(body, "1700000000", "other") != expected
+
+
+def test_delivery_batches_events_per_url_and_signs_them(run, monkeypatch):
+    from aiohttp import web
+
+    monkeypatch.setattr(webhook, "WEBHOOK_BATCH_WINDOW", 0)
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", "secret")
+    monkeypatch.setattr(webhook, "WEBHOOK_ALLOW_PRIVATE", True)
+    received = []
+
+    async def hook(request):
+        body = await request.read()
+        received.append((request.path, request.headers, body))
+        return web.Response(status=204)
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/{name}", hook)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        delivery = WebhookDelivery()
+        try:
+            delivery.enqueue(f"{base}/a", {"event": "complete", "clip_id": "1"})
+            delivery.enqueue(f"{base}/a", {"event": "complete", "clip_id": "2"})
+            delivery.enqueue(f"{base}/b", {"event": "error", "clip_id": "3"})
+            for _ in range(100):
+                if len(received) == 2:
+                    break
+                await asyncio.sleep(0.02)
+        finally:
+            await delivery.stop()
+            await runner.cleanup()
+
+    run(main())
+    by_path = {path: (headers, body) for path, headers, body in received}
+    assert sorted(by_path) == ["/a", "/b"]
+    headers, body = by_path["/a"]
+    assert [e["clip_id"] for e in json.loads(body)["events"]] == ["1", "2"]
+    timestamp = headers["x-suno-api-timestamp"]
+    assert headers["x-suno-api-signature"] == "sha256=" + sign_payload(body, timestamp, "secret")
+
+
+def test_streaming_event_is_sent_once(run, tracker):
+    async def main():
+        tracker.track(["c1"], "https://example.com/hook", include_streaming=True)
+        for _ in range(3):
+            tracker._on_clip({"id": "c1", "status": "streaming"})
+        await tracker.stop()
+    run(main())
+    assert [event["event"] for _, event in tracker.delivery.events] == ["streaming"]
+
+
+def test_streaming_event_needs_opt_in(run, tracker):
+    async def main():
+        tracker.track(["c1"], "https://example.com/hook")
+        tracker._on_clip({"id": "c1", "status": "streaming"})
+        await tracker.stop()
+    run(main())
+    assert tracker.delivery.events == []
+
+
+def test_terminal_event_goes_to_every_subscriber_once(run, tracker):
+    async def main():
+        tracker.track(["c1", "c2"], "https://a.example.com/hook")
+        tracker.track(["c1"], "https://b.example.com/hook")
+        tracker._on_clip({"id": "c1", "status": "complete"})
+        tracker._on_clip({"id": "c1", "status": "complete"})
+        tracker._on_clip({"id": "c2", "status": "error"})
+        await tracker.stop()
+    run(main())
+    sent = [(url, event["clip_id"], event["event"]) for url, event in tracker.delivery.events]
+    assert sent == [
+        ("https://a.example.com/hook", "c1", "complete"),
+        ("https://b.example.com/hook", "c1", "complete"),
+        ("https://a.example.com/hook", "c2", "error"),
+    ]
+    assert tracker.clips == {}
+
+
+def test_timeout_event_on_expiry(run, tracker, monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_TRACK_TIMEOUT", 0)
+
+    async def main():
+        tracker.track(["c1"], "https://example.com/hook")
+        tracker._on_clip({"id": "c1", "status": "queued"})
+        tracker._expire()
+        await tracker.stop()
+    run(main())
+    assert tracker.delivery.events == [("https://example.com/hook", {
+        "event": "timeout", "clip_id": "c1", "status": "queued", "clip": None,
+    })]
+    assert tracker.clips == {}
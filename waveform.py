@@ -0,0 +1,234 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import os
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from admission import DeadlineExceeded, remaining_time, request_deadline
+from scheduler import current_priority
+from suno_client import get_feed, extract_clips
+from prefetch import audio_store
+
+WAVEFORM_CACHE_DIR = os.getenv("WAVEFORM_CACHE_DIR", "waveform_cache")
+WAVEFORM_MEMORY_ITEMS = int(os.getenv("WAVEFORM_MEMORY_ITEMS", "256"))
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# Upper bound on one decode, a stalled CDN stream must not hold the clip forever
+WAVEFORM_DECODE_TIMEOUT = float(os.getenv("WAVEFORM_DECODE_TIMEOUT", "60"))
+SAMPLE_RATE = 22050
+# Resolution decoded once per clip, any smaller bucket count is derived from it
+BASE_BUCKETS = 4096
+MAX_BUCKETS = BASE_BUCKETS
+
+# magic, version, buckets, sample_rate, duration, rms_db, peak_db
+HEADER = struct.Struct("<4sHIIfff")
+MAGIC = b"SWF1"
+
+
+class ClipNotReady(Exception):
+    pass
+
+
+class Waveform:
+    """min/max/RMS peaks as int16 arrays scaled to full range"""
+
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray, rms: np.ndarray,
+                 duration: float, rms_db: float, peak_db: float, sample_rate: int = SAMPLE_RATE):
+        self.mins = mins
+        self.maxs = maxs
+        self.rms = rms
+        self.duration = duration
+        self.rms_db = rms_db
+        self.peak_db = peak_db
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_pcm(cls, pcm: np.ndarray, buckets: int = BASE_BUCKETS) -> "Waveform":
+        """Compute peaks from mono int16 PCM"""
+        if pcm.size == 0:
+            raise Exception("Decoded audio is empty")
+        samples = pcm.astype(np.float32) / 32768.0
+        buckets = min(buckets, samples.size)
+        starts = np.linspace(0, samples.size, buckets + 1).astype(np.int64)[:-1]
+        counts = np.diff(np.append(starts, samples.size))
+        mins = np.minimum.reduceat(samples, starts)
+        maxs = np.maximum.reduceat(samples, starts)
+        rms = np.sqrt(np.add.reduceat(samples * samples, starts) / counts)
+
+        total_rms = float(np.sqrt(np.mean(samples * samples)))
+        peak = float(np.max(np.abs(samples)))
+        return cls(
+            _to_int16(mins), _to_int16(maxs), _to_int16(rms),
+            duration=samples.size / SAMPLE_RATE,
+            rms_db=_to_db(total_rms),
+            peak_db=_to_db(peak),
+        )
+
+    def resample(self, buckets: int) -> "Waveform":
+        """Merge the stored buckets down to `buckets`"""
+        size = self.mins.size
+        if buckets >= size:
+            return self
+        starts = np.linspace(0, size, buckets + 1).astype(np.int64)[:-1]
+        counts = np.diff(np.append(starts, size))
+        rms_sq = self.rms.astype(np.float64) ** 2
+        rms = np.sqrt(np.add.reduceat(rms_sq, starts) / counts)
+        return Waveform(
+            np.minimum.reduceat(self.mins, starts),
+            np.maximum.reduceat(self.maxs, starts),
+            rms.round().astype(np.int16),
+            self.duration, self.rms_db, self.peak_db, self.sample_rate,
+        )
+
+    def to_bytes(self) -> bytes:
+        header = HEADER.pack(
+            MAGIC, 1, self.mins.size, self.sample_rate,
+            self.duration, self.rms_db, self.peak_db
+        )
+        return header + b"".join(a.astype("<i2").tobytes() for a in (self.mins, self.maxs, self.rms))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Waveform":
+        magic, _, buckets, sample_rate, duration, rms_db, peak_db = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a waveform file")
+        arrays = np.frombuffer(data, dtype="<i2", offset=HEADER.size).reshape(3, buckets)
+        return cls(arrays[0], arrays[1], arrays[2], duration, rms_db, peak_db, sample_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": int(self.mins.size),
+            "duration": round(self.duration, 3),
+            "sample_rate": self.sample_rate,
+            "rms_db": round(self.rms_db, 2),
+            "peak_db": round(self.peak_db, 2),
+            "scale": 32767,
+            "min": self.mins.tolist(),
+            "max": self.maxs.tolist(),
+            "rms": self.rms.tolist(),
+        }
+
+
+def _to_int16(values: np.ndarray) -> np.ndarray:
+    return np.clip(np.round(values * 32767), -32768, 32767).astype(np.int16)
+
+
+def _to_db(value: float) -> float:
+    return 20 * float(np.log10(value)) if value > 0 else -120.0
+
+
+async def decode_pcm(source: str) -> np.ndarray:
+    """Decode a file path or URL to mono int16 PCM with ffmpeg"""
+    args = [FFMPEG_BIN, "-v", "error"]
+    if source.startswith(("http://", "https://")):
+        # Fail reads that stall instead of waiting on the socket forever (microseconds)
+        args += ["-rw_timeout", str(int(WAVEFORM_DECODE_TIMEOUT * 1_000_000))]
+    args += ["-i", source, "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-"]
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        raise Exception(f"Audio decoder not found: {FFMPEG_BIN}")
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), WAVEFORM_DECODE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise Exception(f"Decoding audio timed out after {WAVEFORM_DECODE_TIMEOUT:g}s")
+    finally:
+        # Timed out or cancelled, don't leave ffmpeg running
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    if proc.returncode != 0:
+        raise Exception(f"Failed to decode audio: {stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(stdout, dtype="<i2")
+
+
+class WaveformCache:
+    """Base resolution waveforms on disk plus a small in-memory LRU"""
+
+    def __init__(self, directory: str, memory_items: int):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.memory: "OrderedDict[str, Waveform]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    def _path(self, clip_id: str) -> str:
+        safe_id = "".join(c for c in clip_id if c.isalnum() or c in "-_")
+        return os.path.join(self.directory, f"{safe_id}.bin")
+
+    def _remember(self, clip_id: str, waveform: Waveform):
+        self.memory[clip_id] = waveform
+        self.memory.move_to_end(clip_id)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _load(self, clip_id: str) -> Optional[Waveform]:
+        waveform = self.memory.get(clip_id)
+        if waveform is not None:
+            self.memory.move_to_end(clip_id)
+            return waveform
+        path = self._path(clip_id)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                waveform = Waveform.from_bytes(f.read())
+            self._remember(clip_id, waveform)
+            return waveform
+        return None
+
+    def _store(self, clip_id: str, waveform: Waveform):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(clip_id)
+        with open(path + ".part", "wb") as f:
+            f.write(waveform.to_bytes())
+        os.replace(path + ".part", path)
+        self._remember(clip_id, waveform)
+
+    async def get(self, clip_id: str, buckets: int) -> Waveform:
+        waveform = self._load(clip_id)
+        if waveform is None:
+            # Concurrent requests for the same clip share one decode
+            future = self.inflight.get(clip_id)
+            if future is None:
+                future = asyncio.ensure_future(self._compute(clip_id))
+                self.inflight[clip_id] = future
+                future.add_done_callback(lambda _: self.inflight.pop(clip_id, None))
+            try:
+                # Each caller gives up at its own deadline, the shared decode carries on
+                waveform = await asyncio.wait_for(asyncio.shield(future), remaining_time())
+            except asyncio.TimeoutError:
+                if future.done():
+                    raise
+                raise DeadlineExceeded("Request deadline exceeded waiting for waveform")
+        return waveform.resample(buckets)
+
+    async def _compute(self, clip_id: str) -> Waveform:
+        # Shared by every caller, don't inherit the first caller's deadline or priority
+        request_deadline.set(None)
+        current_priority.set("interactive")
+        source = audio_store.get(clip_id)
+        if not source:
+            clips = extract_clips(await get_feed([clip_id]))
+            if not clips:
+                raise LookupError(f"Clip not found: {clip_id}")
+            clip = clips[0]
+            # A clip that is still streaming would give a truncated waveform
+            if clip.get("status") != "complete":
+                raise ClipNotReady(f"Clip is not complete yet: {clip.get('status')}")
+            source = clip.get("audio_url") or clip.get("audioUrl") or clip.get("audio")
+            if not source:
+                raise LookupError(f"Audio URL not found for clip ID: {clip_id}")
+        pcm = await decode_pcm(source)
+        # The reductions are CPU bound, keep them off the event loop
+        waveform = await asyncio.to_thread(Waveform.from_pcm, pcm, BASE_BUCKETS)
+        self._store(clip_id, waveform)
+        return waveform
+
+
+# Global cache instance
+waveform_cache = WaveformCache(WAVEFORM_CACHE_DIR, WAVEFORM_MEMORY_ITEMS)
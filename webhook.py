@@ -0,0 +1,272 @@
+# -*- coding:utf-8 -*-
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp.resolver import ThreadedResolver
+
+from suno_client import get_feed, extract_clips
+from prefetch import prefetcher
+from admission import request_deadline
+from scheduler import current_priority
+
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "10"))
+WEBHOOK_TRACK_TIMEOUT = float(os.getenv("WEBHOOK_TRACK_TIMEOUT", "900"))
+WEBHOOK_BATCH_WINDOW = float(os.getenv("WEBHOOK_BATCH_WINDOW", "1"))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "5"))
+# Allow callbacks to loopback/private/link-local hosts, e.g. n8n on the same Docker network
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+
+# Suno accepts a comma separated id list, keep each poll to a sane size
+FEED_BATCH_SIZE = 50
+TERMINAL_STATUSES = {"complete", "error"}
+
+
+def sign_payload(body: bytes, timestamp: str, secret: str = WEBHOOK_SECRET) -> str:
+    """HMAC-SHA256 signature over "<timestamp>.<body>" """
+    message = timestamp.encode() + b"." + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def is_public_address(host: str) -> bool:
+    """False for loopback, private, link-local, reserved and multicast addresses"""
+    address = ipaddress.ip_address(host.split("%")[0])
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+async def validate_callback_url(url: str):
+    """Raise ValueError unless every address the callback host resolves to is public"""
+    if WEBHOOK_ALLOW_PRIVATE:
+        return
+    host = urlsplit(url).hostname
+    if not host:
+        raise ValueError("callback_url has no host")
+    try:
+        addresses = [host] if _is_ip(host) else [
+            info[4][0] for info in await asyncio.get_running_loop().getaddrinfo(
+                host, None, type=socket.SOCK_STREAM
+            )
+        ]
+    except socket.gaierror:
+        raise ValueError(f"callback_url host does not resolve: {host}")
+    if not all(is_public_address(address) for address in addresses):
+        raise ValueError("callback_url must not point to a loopback, private or link-local address")
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+class PublicResolver(ThreadedResolver):
+    """Drops non-public addresses at connect time, so DNS can't be rebound after validation"""
+
+    async def resolve(self, host: str, port: int = 0, family: socket.AddressFamily = socket.AF_INET):
+        hosts = await super().resolve(host, port, family)
+        public = [h for h in hosts if is_public_address(h["host"])]
+        if not public:
+            raise OSError(f"{host} does not resolve to a public address")
+        return public
+
+
+class WebhookDelivery:
+    """Queues webhook events per callback URL and delivers them in signed batches"""
+
+    def __init__(self):
+        self.pending: Dict[str, List[Dict[str, Any]]] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.inflight: Set[asyncio.Task] = set()
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def enqueue(self, callback_url: str, event: Dict[str, Any]):
+        """Queue an event, it is sent together with anything else for the same URL"""
+        self.pending.setdefault(callback_url, []).append(event)
+        self._ensure_running()
+        self.wakeup.set()
+
+    def _ensure_running(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """One session for every delivery, kept apart from the Suno pool (http_session.py)"""
+        if self.session is None or self.session.closed:
+            resolver = None if WEBHOOK_ALLOW_PRIVATE else PublicResolver()
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=resolver))
+        return self.session
+
+    async def stop(self):
+        tasks = [task for task in [self.task, *self.inflight] if task and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            # Give other clips of the same generation a chance to join the batch
+            await asyncio.sleep(WEBHOOK_BATCH_WINDOW)
+            self.wakeup.clear()
+            batches, self.pending = self.pending, {}
+            for callback_url, events in batches.items():
+                task = asyncio.create_task(self._deliver(callback_url, events))
+                self.inflight.add(task)
+                task.add_done_callback(self.inflight.discard)
+
+    async def _deliver(self, callback_url: str, events: List[Dict[str, Any]]):
+        body = json.dumps({"events": events}).encode()
+        delay = 1.0
+        for attempt in range(1, WEBHOOK_MAX_RETRIES + 1):
+            timestamp = str(int(time.time()))
+            headers = {
+                "content-type": "application/json",
+                "x-suno-api-timestamp": timestamp,
+            }
+            if WEBHOOK_SECRET:
+                headers["x-suno-api-signature"] = f"sha256={sign_payload(body, timestamp, WEBHOOK_SECRET)}"
+            try:
+                async with self._get_session().post(
+                    callback_url,
+                    data=body,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=30),
+                    allow_redirects=False,
+                ) as resp:
+                    if resp.status < 300:
+                        return
+                    # Client errors other than rate limiting will not fix themselves
+                    if 400 <= resp.status < 500 and resp.status != 429:
+                        print(f"Webhook rejected by {callback_url}: {resp.status}")
+                        return
+                    print(f"Webhook delivery to {callback_url} failed: {resp.status}")
+            except Exception as e:
+                print(f"Webhook delivery to {callback_url} failed: {e}")
+            if attempt < WEBHOOK_MAX_RETRIES:
+                await asyncio.sleep(delay)
+                delay *= 2
+        print(f"Giving up on webhook delivery to {callback_url} after {WEBHOOK_MAX_RETRIES} attempts")
+
+
+@dataclass
+class Subscription:
+    callback_url: Optional[str]
+    include_streaming: bool = False
+    deadline: float = 0.0
+    last_status: Optional[str] = None
+
+
+class CompletionTracker:
+    """Polls get_feed in batches for tracked clips and fires webhooks on status changes"""
+
+    def __init__(self, delivery: WebhookDelivery):
+        self.delivery = delivery
+        self.clips: Dict[str, List[Subscription]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def track(self, clip_ids: List[str], callback_url: Optional[str] = None, include_streaming: bool = False):
+        """Start watching clips, callback_url receives an event once each one finishes
+
+        Without a callback_url the clip is only watched so the prefetcher can pick it up.
+        """
+        deadline = time.time() + WEBHOOK_TRACK_TIMEOUT
+        for clip_id in clip_ids:
+            self.clips.setdefault(clip_id, []).append(
+                Subscription(callback_url, include_streaming, deadline)
+            )
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _run(self):
+        # Started from a request handler, don't compete with interactive traffic
+        # and don't inherit that request's deadline
+        current_priority.set("batch")
+        request_deadline.set(None)
+        while self.clips:
+            await asyncio.sleep(WEBHOOK_POLL_INTERVAL)
+            clip_ids = list(self.clips.keys())
+            for i in range(0, len(clip_ids), FEED_BATCH_SIZE):
+                batch = clip_ids[i:i + FEED_BATCH_SIZE]
+                try:
+                    feed_data = await get_feed(batch)
+                except Exception as e:
+                    print(f"Completion tracker poll failed: {e}")
+                    continue
+                for clip in extract_clips(feed_data):
+                    self._on_clip(clip)
+            self._expire()
+
+    def _on_clip(self, clip: Dict[str, Any]):
+        clip_id = clip.get("id")
+        subscriptions = self.clips.get(clip_id)
+        if subscriptions is None:
+            return
+        status = clip.get("status")
+        if status in TERMINAL_STATUSES:
+            prefetcher.schedule(clip)
+            for sub in subscriptions:
+                if sub.callback_url:
+                    self.delivery.enqueue(sub.callback_url, self._event(status, clip))
+            del self.clips[clip_id]
+            return
+        for sub in subscriptions:
+            if sub.callback_url and sub.include_streaming and status == "streaming" and sub.last_status != status:
+                self.delivery.enqueue(sub.callback_url, self._event(status, clip))
+            sub.last_status = status
+
+    def _expire(self):
+        now = time.time()
+        for clip_id in list(self.clips.keys()):
+            subscriptions = self.clips[clip_id]
+            expired = [sub for sub in subscriptions if sub.deadline <= now]
+            for sub in expired:
+                if sub.callback_url:
+                    self.delivery.enqueue(sub.callback_url, {
+                        "event": "timeout",
+                        "clip_id": clip_id,
+                        "status": sub.last_status,
+                        "clip": None,
+                    })
+                subscriptions.remove(sub)
+            if not subscriptions:
+                del self.clips[clip_id]
+
+    @staticmethod
+    def _event(status: str, clip: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "event": status,
+            "clip_id": clip.get("id"),
+            "status": status,
+            "clip": clip,
+        }
+
+
+# Global tracker instance
+webhook_delivery = WebhookDelivery()
+completion_tracker = CompletionTracker(webhook_delivery)